@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+import asyncio
+import functools
+import os
+import threading
+import weakref
+
+from concurrent.futures import ThreadPoolExecutor
+
+from .meme import Meme
+
+
+class AsyncPipeline(object):
+    """ Bounded download -> render -> upload pipeline for asyncio callers.
+
+        Blocking stages run in executors; each stage has its own
+        concurrency limit shared by every meme that goes through the
+        pipeline:
+
+            pipeline = AsyncPipeline(download=16, render=4, upload=16)
+            path = await AsyncMeme(logger, template, url, text,
+                                   pipeline=pipeline).make_meme(path)
+
+        asyncio semaphores belong to one event loop, so the limits apply
+        per running loop; the executors are shared by all of them.
+    """
+
+    stages = ('download', 'render', 'upload')
+
+    def __init__(self, download=8, render=None, upload=8,
+                 executor=None, render_executor=None):
+        render = render or os.cpu_count() or 1
+        self.limits = {
+            'download': download,
+            'render': render,
+            'upload': upload,
+        }
+        self.semaphores = weakref.WeakKeyDictionary()
+        self.lock = threading.Lock()
+        self.executor = executor or ThreadPoolExecutor(
+            max_workers=download + upload)
+        self.render_executor = render_executor or ThreadPoolExecutor(
+            max_workers=render)
+
+    def semaphore(self, stage, loop):
+        with self.lock:
+            semaphores = self.semaphores.get(loop)
+            if semaphores is None:
+                semaphores = self.semaphores[loop] = dict(
+                    (name, asyncio.Semaphore(limit))
+                    for name, limit in self.limits.items()
+                )
+            return semaphores[stage]
+
+    async def run(self, stage, fn, *args, **kwargs):
+        executor = self.render_executor if stage == 'render' else self.executor
+        loop = asyncio.get_running_loop()
+        async with self.semaphore(stage, loop):
+            return await loop.run_in_executor(
+                executor, functools.partial(fn, *args, **kwargs))
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
+        self.render_executor.shutdown(wait=wait)
+
+
+_default_pipeline = None
+
+
+def get_pipeline():
+    """Pipeline shared by AsyncMemes created without an explicit one."""
+    global _default_pipeline
+    if _default_pipeline is None:
+        _default_pipeline = AsyncPipeline()
+    return _default_pipeline
+
+
+class AsyncMeme(Meme):
+
+    def __init__(self, *args, **kwargs):
+        self.pipeline = kwargs.pop('pipeline', None) or get_pipeline()
+        super(AsyncMeme, self).__init__(*args, **kwargs)
+
+    async def make_meme(self, path):
+        if not await self.pipeline.run('download', self.prepare_meme, path):
+            return self.meme_path
+
+        await self.pipeline.run('render', self.draw_meme)
+        await self.pipeline.run('upload', self.store_meme)
+
+        return self.meme_path
+
+
+async def make_meme(logger, template, url, text, path, pipeline=None, **kwargs):
+    meme = AsyncMeme(logger, template, url, text, pipeline=pipeline, **kwargs)
+    return await meme.make_meme(path)
@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+import hashlib
+import io
+import os
+import threading
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+CONTENT_TYPES = {
+    'GIF': 'image/gif',
+    'WEBP': 'image/webp',
+}
+
+DEFAULT_DURATION = 100
+
+FRAME_WORKERS = os.cpu_count() or 2
+
+# Frames, evenly spread over the animation, and pixels of the montage
+# the shared GIF palette is built from.
+PALETTE_SAMPLE_FRAMES = 16
+PALETTE_SAMPLE_PIXELS = 1024 * 1024
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Thread pool shared by all animations; Pillow releases the GIL while compositing."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=FRAME_WORKERS,
+                                           thread_name_prefix='meme-frames')
+        return _executor
+
+
+def caption_frame(frame, captions=None, palette=None):
+    """Paste (band, box) captions onto one RGB frame, quantizing it to `palette`."""
+    from PIL import Image
+
+    for band, box in captions or ():
+        frame.paste(band, box, band)
+    if palette is not None:
+        frame = frame.quantize(palette=palette, dither=Image.Dither.NONE)
+    return frame
+
+
+def shared_palette(frames, size):
+    """ One palette for every frame of a GIF, built from a montage of
+        `frames`, so colors do not flicker between frames and each frame
+        is only mapped to it instead of being quantized on its own.
+    """
+    from PIL import Image
+
+    montage = Image.new('RGB', (size[0], size[1] * len(frames)))
+    for index, frame in enumerate(frames):
+        montage.paste(frame, (0, size[1] * index))
+    return montage.quantize(colors=256, method=Image.Quantize.MEDIANCUT)
+
+
+class Animation(object):
+    """ Animated GIF/WebP template.
+
+        Only the encoded source is kept; frames are decoded one at a time
+        while a meme is encoded. GIFs are written frame by frame as well,
+        so their memory does not grow with the number of frames (Pillow's
+        WebP encoder takes all frames at once). Animations larger than
+        `max_size` are re-encoded at the fitted size once, when decoded, so
+        the stored and cached template is the downscaled copy:
+
+            animation = Animation(data, max_size=(2048, 2048))
+            animation.save(fp, get_format('gif'), captions)
+
+        Captions are drawn once onto small RGBA bands by the caller and
+        pasted onto every frame in a thread pool, a bounded window of
+        frames at a time.
+    """
+
+    def __init__(self, data, max_size=None):
+        from PIL import Image
+
+        self.data = bytes(data)
+        source = Image.open(io.BytesIO(self.data))
+        self.format = source.format
+        self.n_frames = getattr(source, 'n_frames', 1)
+        self.loop = source.info.get('loop', 0)
+        self.source_size = source.size
+        self.size = source.size
+        if max_size and (source.width > max_size[0] or source.height > max_size[1]):
+            ratio = min(max_size[0] / float(source.width),
+                        max_size[1] / float(source.height))
+            self.size = (max(1, int(round(source.width * ratio))),
+                         max(1, int(round(source.height * ratio))))
+            self.normalize()
+
+    def normalize(self):
+        """Re-encode the animation at its fitted size, in its source format."""
+        from .formats import get_format
+
+        buffer = io.BytesIO()
+        self.save(buffer, get_format(self.extension))
+        self.data = buffer.getvalue()
+        self.source_size = self.size
+
+    @property
+    def content_type(self):
+        return CONTENT_TYPES.get(self.format, 'application/octet-stream')
+
+    @property
+    def extension(self):
+        return self.format.lower()
+
+    @property
+    def nbytes(self):
+        return len(self.data)
+
+    def digest(self):
+        key = self.data + repr(self.size).encode('utf-8')
+        return hashlib.sha1(key).hexdigest()
+
+    def frames(self):
+        """Yield (RGB frame, duration in ms), decoding one frame at a time."""
+        from PIL import Image, ImageSequence
+
+        source = Image.open(io.BytesIO(self.data))
+        for frame in ImageSequence.Iterator(source):
+            # WebP sets the duration of a frame only when it is loaded.
+            frame = frame.convert('RGB')
+            duration = source.info.get('duration') or DEFAULT_DURATION
+            if frame.size != self.size:
+                frame = frame.resize(self.size, Image.LANCZOS)
+            yield frame, duration
+
+    def first_frame(self):
+        return next(self.frames())[0]
+
+    def palette(self, captions=None):
+        """ Shared palette of the captioned animation, from up to
+            PALETTE_SAMPLE_FRAMES frames downscaled while decoding. Frames
+            that are not sampled are only seeked past.
+        """
+        from PIL import Image, ImageSequence
+
+        step = max(1, -(-self.n_frames // PALETTE_SAMPLE_FRAMES))
+        scale = min(1.0, (PALETTE_SAMPLE_PIXELS / float(
+            self.size[0] * self.size[1] * min(self.n_frames, PALETTE_SAMPLE_FRAMES))) ** 0.5)
+        size = (max(1, int(self.size[0] * scale)), max(1, int(self.size[1] * scale)))
+        samples = []
+        source = Image.open(io.BytesIO(self.data))
+        for index, frame in enumerate(ImageSequence.Iterator(source)):
+            if len(samples) >= PALETTE_SAMPLE_FRAMES:
+                break
+            if index % step:
+                continue
+            frame = frame.convert('RGB')
+            if frame.size != self.size:
+                frame = frame.resize(self.size, Image.LANCZOS)
+            for band, box in captions or ():
+                frame.paste(band, box, band)
+            samples.append(frame.resize(size, Image.NEAREST))
+        return shared_palette(samples, size)
+
+    def captioned(self, captions=None, palette=None, executor=None, window=None):
+        """ Yield (frame, duration) with the (band, box) `captions` pasted
+            on, in order.
+
+            Up to `window` frames are rendered concurrently. With a
+            `palette` frames are mapped to it and come out in P mode.
+        """
+        executor = executor or get_executor()
+        window = window or 2 * FRAME_WORKERS
+        pending = deque()
+        for frame, duration in self.frames():
+            if len(pending) >= window:
+                future, pending_duration = pending.popleft()
+                yield future.result(), pending_duration
+            pending.append((executor.submit(caption_frame, frame, captions, palette), duration))
+        while pending:
+            future, duration = pending.popleft()
+            yield future.result(), duration
+
+    def save(self, fp, output_format, captions=None, executor=None):
+        """Encode the captioned animation to `fp` as `output_format` (gif or webp)."""
+        if output_format.name == 'gif':
+            frames = self.captioned(captions, self.palette(captions), executor=executor)
+            write_gif(fp, frames, loop=self.loop)
+            return
+        frames = self.captioned(captions, executor=executor)
+        first, duration = next(frames)
+        durations = [duration]
+        # Pillow's WebP encoder takes all frames at once.
+        rest = []
+        for frame, duration in frames:
+            rest.append(frame)
+            durations.append(duration)
+        first.save(fp, format=output_format.name, save_all=True, append_images=rest,
+                   duration=durations, loop=self.loop, **output_format.options)
+
+
+def write_gif(fp, frames, loop=0):
+    """ Stream P-mode frames sharing one palette into an animated GIF;
+        every frame is written as soon as it is rendered.
+    """
+    from PIL import GifImagePlugin
+
+    for index, (frame, duration) in enumerate(frames):
+        if index == 0:
+            header, _ = GifImagePlugin.getheader(
+                frame, info={'loop': loop, 'duration': duration})
+            fp.write(b''.join(header))
+        fp.write(b''.join(GifImagePlugin.getdata(frame, duration=duration, disposal=1)))
+    fp.write(b';')
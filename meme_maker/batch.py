@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+import csv
+import json
+import logging
+import os
+import shutil
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing.util import Finalize
+
+from .layout import layouts as worker_layouts
+from .meme import Meme, plugins
+from .storage import recognize_storage
+from .templates import TemplateCache, shared_directory, templates as worker_templates
+
+
+logger = logging.getLogger('meme.batch')
+
+JOB_FIELDS = ('meme', 'url', 'text')
+
+# Per-process state, populated by `init_worker` in every pool process.
+worker = {}
+
+
+def read_jobs(stream, format='jsonl'):
+    """ Yield job dicts with `meme`, `url` and `text` keys from a JSONL or
+        CSV stream.
+    """
+    if format == 'csv':
+        rows = csv.DictReader(stream)
+    elif format == 'jsonl':
+        rows = (json.loads(line) for line in stream if line.strip())
+    else:
+        raise ValueError('Unsupported jobs format: {}'.format(format))
+
+    for row in rows:
+        yield dict((field, row.get(field) or None) for field in JOB_FIELDS)
+
+
+def guess_format(filename):
+    ext = os.path.splitext(filename or '')[1].lower()
+    return 'csv' if ext == '.csv' else 'jsonl'
+
+
+def share_templates(jobs, path, directory, workers=8):
+    """ Decode the template of every distinct job once, into the disk tier
+        at `directory`, fetching up to `workers` templates at a time.
+        Workers using that directory map the decoded pixels instead of each
+        decoding and holding their own copy.
+    """
+    storage = recognize_storage(path, logger)
+    cache = TemplateCache(maxbytes=0, directory=directory,
+                          disk_maxbytes=worker_templates.disk_maxbytes)
+    memes = {}
+    for job in jobs:
+        meme = Meme(logging.getLogger('meme'), job.get('meme'), job.get('url'), '',
+                    template_cache=cache, storage=storage)
+        if meme.url and not meme.template_name:
+            meme.template_name = meme.generate_template_name()
+        memes.setdefault(meme.template_key(), meme)
+
+    def run(meme):
+        try:
+            meme.set_paths()
+            meme.load_template()
+        except Exception as exc:
+            logger.error('Unable to load template %s: %s' % (meme.template_name, exc))
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(run, memes.values()))
+    return len(memes)
+
+
+def init_worker(path, formats=None, layouts=None, templates_directory=None):
+    worker['path'] = path
+    worker['formats'] = formats
+    worker['logger'] = logging.getLogger('meme')
+    if layouts:
+        worker_layouts.update(layouts)
+    if templates_directory:
+        worker_templates.directory = templates_directory
+
+
+def init_pool_worker(*args):
+    init_worker(*args)
+    # Pool processes skip atexit; flush background plugins on their exit.
+    Finalize(None, plugins.flush, exitpriority=10)
+
+
+def render_job(job):
+    """ Render one job in a worker. Returns the meme path and, when the
+        meme was drawn, its layout so the parent can collect it.
+    """
+    meme = Meme(
+        worker['logger'],
+        job.get('meme'),
+        job.get('url'),
+        job.get('text') or '',
+        formats=worker['formats']
+    )
+    try:
+        path = meme.make_meme(worker['path'])
+    except Exception as exc:
+        worker['logger'].error('Unable to render job %s: %s' % (job, exc))
+        return None, None
+
+    if meme.image is None:
+        return path, None
+    key = meme.layout_key()
+    layout = worker_layouts.get(key)
+    return path, (key, layout.to_dict()) if layout is not None else None
+
+
+def make_memes(jobs, path, workers=None, chunksize=1, formats=None, layouts=None,
+               shared_templates=True):
+    """ Render many memes; templates and fonts are loaded once per worker
+        through the process-wide template cache and font registry.
+
+        Returns meme paths in the order of `jobs`, with None for jobs that
+        failed. `workers=0` renders in the calling process. `formats` are
+        output format names or `OutputFormat`s, PNG by default.
+
+        Workers start with the layouts of the `layouts` LayoutCache, and
+        layouts they compute are added back to it.
+
+        With `shared_templates` the templates are decoded once, before the
+        pool starts, into the template cache directory (a temporary one on
+        tmpfs without MEME_MAKER_CACHE_DIR) that every worker maps.
+    """
+    jobs = list(jobs)
+    initargs = (path, formats, layouts.snapshot() if layouts else None)
+
+    if workers == 0:
+        init_worker(*initargs)
+        results = [render_job(job) for job in jobs]
+    else:
+        directory = temporary = None
+        if shared_templates:
+            directory = worker_templates.directory
+            if directory is None:
+                directory = temporary = shared_directory()
+            count = share_templates(jobs, path, directory)
+            logger.info('shared %s templates in %s' % (count, directory))
+        logger.info('rendering %s memes' % len(jobs))
+        try:
+            with ProcessPoolExecutor(max_workers=workers,
+                                     initializer=init_pool_worker,
+                                     initargs=initargs + (directory,)) as executor:
+                results = list(executor.map(render_job, jobs, chunksize=chunksize))
+        finally:
+            if temporary is not None:
+                shutil.rmtree(temporary, ignore_errors=True)
+
+    if layouts is not None:
+        layouts.update(item for _, item in results if item is not None)
+    return [path for path, _ in results]
@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+import importlib.util
+import json
+import logging
+import os
+import resource
+import shutil
+import tempfile
+import textwrap
+import time
+
+from PIL import Image
+
+from .layout import LayoutCache
+from .meme import Meme
+from .storage import LocalStorage, MemoryStorage, S3Storage
+from .templates import TemplateCache
+
+
+TEMPLATE_SIZES = {
+    'small': (320, 240),
+    'medium': (800, 600),
+    'large': (1920, 1080),
+}
+
+CAPTION_LENGTHS = (1, 20, 80, 300)
+
+STORAGES = ('local', 's3')
+
+STAGES = ('optimize_font', 'layout', 'draw', 'store_image', 'make_meme')
+
+
+def synthetic_template(size):
+    """Deterministic, photo-like (hard to compress) RGB template."""
+    red = Image.effect_mandelbrot(size, (-2.0, -1.2, 1.0, 1.2), 64)
+    green = Image.linear_gradient('L').resize(size)
+    blue = Image.effect_noise(size, 48)
+    return Image.merge('RGB', (red, green, blue))
+
+
+def synthetic_caption(length):
+    words = ('ONE', 'DOES', 'NOT', 'SIMPLY', 'RENDER', 'A', 'MEME', 'FAST')
+    text = ' '.join(words[i % len(words)] for i in range(length))[:length]
+    if length < 20:
+        return text
+    middle = length // 2
+    return '%s|%s' % (text[:middle], text[middle:])
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))
+    return ordered[index]
+
+
+def summarize(samples):
+    total = sum(samples)
+    return {
+        'p50': percentile(samples, 0.5),
+        'p90': percentile(samples, 0.9),
+        'p99': percentile(samples, 0.99),
+        'mean': total / len(samples),
+        'throughput': len(samples) / total if total else 0.0,
+    }
+
+
+def peak_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class S3Stub(object):
+    """Context manager providing an S3Storage backed by moto."""
+
+    bucket = 'meme-maker-bench'
+
+    def __enter__(self):
+        from moto import mock_aws
+        import boto3
+
+        os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+        self.mock = mock_aws()
+        self.mock.start()
+        client = boto3.client('s3')
+        client.create_bucket(Bucket=self.bucket)
+        return S3Storage(self.bucket, '', client=client)
+
+    def __exit__(self, *exc_info):
+        self.mock.stop()
+
+
+class LocalStub(object):
+
+    def __enter__(self):
+        self.path = tempfile.mkdtemp() + '/'
+        return LocalStorage(self.path)
+
+    def __exit__(self, *exc_info):
+        shutil.rmtree(self.path)
+
+
+class MemoryStub(object):
+
+    def __enter__(self):
+        return MemoryStorage()
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+class Benchmark(object):
+    """ Render pipeline benchmark over synthetic templates and captions.
+
+            results = Benchmark(iterations=10).run()
+            regressions = compare(results, load_baseline('bench.json'))
+
+        Every case (template size, caption length, storage) reports latency
+        percentiles and throughput per stage. When moto is not installed
+        the S3 cases fall back to in-memory storage.
+    """
+
+    def __init__(self, iterations=5, sizes=None, lengths=CAPTION_LENGTHS,
+                 storages=STORAGES):
+        self.iterations = iterations
+        self.sizes = dict((name, TEMPLATE_SIZES[name])
+                          for name in (sizes or TEMPLATE_SIZES))
+        self.lengths = lengths
+        self.storages = storages
+        self.logger = logging.getLogger('meme.bench')
+        self.logger.setLevel(logging.WARNING)
+
+    def storage_stub(self, storage):
+        if storage == 's3':
+            if importlib.util.find_spec('moto') is not None:
+                return S3Stub()
+            self.logger.warning('moto not installed, using memory storage for s3')
+            return MemoryStub()
+        return LocalStub()
+
+    def make(self, text, template, storage, templates, layouts):
+        meme = Meme(self.logger, 'bench', None, text, storage=storage,
+                    template_cache=templates, layout_cache=layouts)
+        meme.set_paths()
+        meme.image = template
+        return meme
+
+    def timed(self, samples, stage, fn, *args):
+        start = time.perf_counter()
+        result = fn(*args)
+        samples.setdefault(stage, []).append(time.perf_counter() - start)
+        return result
+
+    def run_case(self, size, length, storage):
+        template = synthetic_template(size)
+        text = synthetic_caption(length)
+        samples = {}
+
+        for iteration in range(self.iterations):
+            templates = TemplateCache()
+            layouts = LayoutCache()
+            templates.put((storage.root, 'bench'), template)
+
+            meme = self.make(text, template, storage, templates, layouts)
+            top = meme.normalized_text().split('|')[0]
+            lines = textwrap.wrap(top, meme.set_text_wrapping(len(top)))
+            self.timed(samples, 'optimize_font', meme.optimize_font, lines)
+            self.timed(samples, 'layout', meme.get_layout)
+            self.timed(samples, 'draw', meme.draw_meme)
+            self.timed(samples, 'store_image', meme.store_image,
+                       '%sme/me/bench-%s.png' % (storage.path, iteration))
+
+            # Unique text per iteration, so the render cache never
+            # short-circuits the end-to-end measurement.
+            meme = Meme(self.logger, 'bench', None, '%s %s' % (text, iteration),
+                        storage=storage, template_cache=templates,
+                        layout_cache=layouts)
+            self.timed(samples, 'make_meme', meme.make_meme, storage.path)
+
+        return dict((stage, summarize(samples[stage])) for stage in STAGES)
+
+    def run(self):
+        results = {'cases': {}}
+        for storage_name in self.storages:
+            with self.storage_stub(storage_name) as storage:
+                for size_name, size in sorted(self.sizes.items()):
+                    for length in self.lengths:
+                        case = '%s/%s/%s' % (storage_name, size_name, length)
+                        results['cases'][case] = self.run_case(size, length, storage)
+        results['peak_rss_kb'] = peak_rss_kb()
+        return results
+
+
+def save_baseline(results, path):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+
+def load_baseline(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(results, baseline, threshold=0.25, metric='p50'):
+    """ Return (case, stage, baseline, current) for every stage whose
+        `metric` got slower than the baseline by more than `threshold`.
+    """
+    regressions = []
+    for case, stages in sorted(results['cases'].items()):
+        baseline_stages = baseline.get('cases', {}).get(case, {})
+        for stage, stats in sorted(stages.items()):
+            if stage not in baseline_stages:
+                continue
+            before = baseline_stages[stage][metric]
+            if before and stats[metric] > before * (1 + threshold):
+                regressions.append((case, stage, before, stats[metric]))
+    return regressions
+
+
+def format_results(results):
+    lines = ['%-24s %-14s %9s %9s %9s %9s' % (
+        'case', 'stage', 'p50 ms', 'p90 ms', 'p99 ms', 'ops/s')]
+    for case, stages in sorted(results['cases'].items()):
+        for stage in STAGES:
+            stats = stages[stage]
+            lines.append('%-24s %-14s %9.2f %9.2f %9.2f %9.1f' % (
+                case, stage, stats['p50'] * 1000, stats['p90'] * 1000,
+                stats['p99'] * 1000, stats['throughput']))
+    lines.append('peak RSS: %.1f MB' % (results['peak_rss_kb'] / 1024.0))
+    return '\n'.join(lines)
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+import threading
+
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """ Bounded, thread-safe least-recently-used mapping.
+
+        Entries are evicted once either `maxsize` entries are stored or the
+        summed `sizeof(value)` exceeds `maxbytes` (when given).
+
+            cache = LRUCache(maxsize=32)
+            cache.put(key, value)
+            cache.get(key)
+            cache.stats()  # {'hits': 1, 'misses': 0, ...}
+    """
+
+    def __init__(self, maxsize=128, maxbytes=None, sizeof=None):
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof or (lambda value: 0)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.currbytes = 0
+        self._data = OrderedDict()
+        self._lock = threading.RLock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            if key in self._data:
+                self.currbytes -= self.sizeof(self._data.pop(key))
+            self._data[key] = value
+            self.currbytes += self.sizeof(value)
+            self._evict()
+
+    def get_or_create(self, key, factory):
+        with self._lock:
+            value = self.get(key, _missing)
+            if value is _missing:
+                value = factory()
+                self.put(key, value)
+            return value
+
+    def pop(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            value = self._data.pop(key)
+            self.currbytes -= self.sizeof(value)
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.currbytes = 0
+            self.hits = self.misses = self.evictions = 0
+
+    def _evict(self):
+        while self._data and (
+                len(self._data) > self.maxsize or
+                (self.maxbytes is not None and self.currbytes > self.maxbytes)):
+            key, value = self._data.popitem(last=False)
+            self.currbytes -= self.sizeof(value)
+            self.evictions += 1
+
+    def items(self):
+        with self._lock:
+            return list(self._data.items())
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self._data),
+            'bytes': self.currbytes,
+        }
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+
+_missing = object()
@@ -2,26 +2,220 @@
 
 import click
 import logging
+import os
+import sys
 
+from .formats import ALIASES, FORMATS, get_formats
 from .meme import Meme
+from .storage import StorageError
 
 LOG_FORMAT = "%(levelname)9s [%(asctime)-15s] %(name)s - %(message)s"
 CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'])
 
 
-@click.command(context_settings=CONTEXT_SETTINGS)
+class DefaultGroup(click.Group):
+    """Group which runs `default_command` when no subcommand is given,
+    so `meme-maker -m template -u url text` keeps working."""
+
+    default_command = 'make'
+
+    def parse_args(self, ctx, args):
+        if not args or (args[0] not in self.commands and
+                        args[0] not in ctx.help_option_names):
+            args.insert(0, self.default_command)
+        return super(DefaultGroup, self).parse_args(ctx, args)
+
+
+def output_format_options(command):
+    options = [
+        click.option('--output-format', '-o', 'output_formats', multiple=True,
+                     type=click.Choice(sorted(FORMATS) + sorted(ALIASES)),
+                     help='output format, may be repeated (default: png)'),
+        click.option('--quality', '-q', type=click.IntRange(1, 100),
+                     help='JPEG/WebP quality'),
+        click.option('--lossless/--lossy', default=None,
+                     help='WebP lossless encoding'),
+        click.option('--progressive/--baseline', default=None,
+                     help='progressive JPEG'),
+        click.option('--compress-level', type=click.IntRange(0, 9),
+                     help='PNG zlib compression level'),
+    ]
+    for option in reversed(options):
+        command = option(command)
+    return command
+
+
+def make_output_formats(output_formats, **options):
+    return get_formats(output_formats or ['png'], **options)
+
+
+@click.group(cls=DefaultGroup, context_settings=CONTEXT_SETTINGS)
+def cli():
+    logging.basicConfig(format=LOG_FORMAT, level=logging.INFO)
+
+
+@cli.command()
 @click.option('--meme', '-m', help='meme template to be used')
 @click.option('--url', '-u', help='image url')
+@output_format_options
 @click.argument('text', nargs=-1)
-def cli(meme, url, text):
+def make(meme, url, text, output_formats, **format_options):
+    """Make a single meme."""
     if not meme or not url:
         raise click.BadParameter('No parameters specified')
     template = meme
-    logging.basicConfig(format=LOG_FORMAT, level=logging.INFO)
     logger = logging.getLogger('meme')
 
-    meme = Meme(logger, template, url, text[0])
-    meme.make_meme('/tmp/')
+    formats = make_output_formats(output_formats, **format_options)
+    meme = Meme(logger, template, url, text[0], formats=formats)
+    try:
+        meme.make_meme('/tmp/')
+    except StorageError:
+        sys.exit(1)
+
+
+@cli.command()
+@click.option('--path', '-p', default='/tmp/', show_default=True,
+              help='local directory or s3 bucket/prefix')
+@click.option('--workers', '-w', type=int, default=None,
+              help='number of worker processes (0 renders inline)')
+@click.option('--format', '-f', 'jobs_format', type=click.Choice(['jsonl', 'csv']),
+              help='jobs format, guessed from the file extension by default')
+@click.option('--layouts', '-l', 'layouts_path', type=click.Path(dir_okay=False),
+              help='JSON file with text layouts shared between runs')
+@output_format_options
+@click.argument('jobs', type=click.File('r'), default='-')
+def batch(path, workers, jobs_format, layouts_path, jobs, output_formats,
+          **format_options):
+    """Make memes for every job (meme, url, text) in a JSONL/CSV file or stdin."""
+    from .batch import guess_format, make_memes, read_jobs
+    from .layout import LayoutCache
+
+    layouts = LayoutCache()
+    if layouts_path and os.path.exists(layouts_path):
+        with open(layouts_path) as f:
+            layouts.load(f)
+
+    jobs_format = jobs_format or guess_format(jobs.name)
+    formats = make_output_formats(output_formats, **format_options)
+    try:
+        results = make_memes(read_jobs(jobs, jobs_format), path, workers=workers,
+                             formats=formats, layouts=layouts)
+    except StorageError:
+        sys.exit(1)
+
+    if layouts_path:
+        with open(layouts_path, 'w') as f:
+            layouts.dump(f)
+    for result in results:
+        click.echo(result or '')
+    if not all(results):
+        sys.exit(1)
+
+
+@cli.group()
+def templates():
+    """Manage stored templates."""
+
+
+@templates.command('import')
+@click.option('--path', '-p', default='/tmp/', show_default=True,
+              help='local directory or s3 bucket/prefix')
+@click.option('--workers', '-w', type=int, default=8, show_default=True,
+              help='templates fetched concurrently')
+@click.option('--format', '-f', 'templates_format', type=click.Choice(['jsonl', 'csv']),
+              help='templates format, guessed from the file extension by default')
+@click.argument('source', type=click.File('r'), default='-')
+def import_templates(path, workers, templates_format, source):
+    """Import templates (name, url) from a JSONL/CSV file or stdin and index them."""
+    from .batch import guess_format
+    from .importer import import_templates, read_templates
+
+    templates_format = templates_format or guess_format(source.name)
+    try:
+        index, failed = import_templates(
+            read_templates(source, templates_format), path, workers=workers)
+    except StorageError:
+        sys.exit(1)
+
+    for name, entry in sorted(index.entries.items()):
+        click.echo('%s %s %sx%s %s %s' % (
+            name, entry.digest, entry.width, entry.height, entry.format, entry.bytes))
+    for name in failed:
+        click.echo('FAILED %s' % name, err=True)
+    if failed:
+        sys.exit(1)
+
+
+@cli.command()
+@click.option('--host', default='127.0.0.1', show_default=True,
+              help='address to listen on')
+@click.option('--port', '-P', type=int, default=8080, show_default=True,
+              help='port to listen on')
+@click.option('--path', '-p', default='/tmp/', show_default=True,
+              help='local directory or s3 bucket/prefix')
+@click.option('--workers', '-w', type=int, default=1, show_default=True,
+              help='number of pre-forked worker processes')
+@click.option('--threads', type=int, default=4, show_default=True,
+              help='concurrent renders per worker')
+@click.option('--queue-size', type=int, default=16, show_default=True,
+              help='requests waiting per worker before answering 503')
+@output_format_options
+def serve(host, port, path, workers, threads, queue_size, output_formats,
+          **format_options):
+    """Serve memes over HTTP with warm caches."""
+    from .server import WorkerError, serve as serve_forever
+
+    formats = make_output_formats(output_formats, **format_options)
+    try:
+        serve_forever(host, port, path, workers=workers, threads=threads,
+                      queue_size=queue_size, formats=formats)
+    except WorkerError as exc:
+        click.echo(str(exc), err=True)
+        sys.exit(1)
+
+
+@cli.command()
+@click.option('--iterations', '-n', type=int, default=5, show_default=True,
+              help='renders per case')
+@click.option('--size', '-s', 'sizes', multiple=True,
+              type=click.Choice(['small', 'medium', 'large']),
+              help='template sizes to run (default: all)')
+@click.option('--storage', 'storages', multiple=True,
+              type=click.Choice(['local', 's3']),
+              help='storages to run (default: all)')
+@click.option('--baseline', '-b', type=click.Path(dir_okay=False),
+              help='baseline JSON file to compare against')
+@click.option('--save-baseline', is_flag=True,
+              help='write results to the baseline file instead of comparing')
+@click.option('--threshold', '-t', type=float, default=0.25, show_default=True,
+              help='allowed p50 slowdown against the baseline')
+def bench(iterations, sizes, storages, baseline, save_baseline, threshold):
+    """Benchmark the render pipeline."""
+    from . import bench as benchmark
+
+    logging.getLogger('meme').setLevel(logging.WARNING)
+    results = benchmark.Benchmark(
+        iterations=iterations,
+        sizes=sizes or None,
+        storages=storages or benchmark.STORAGES
+    ).run()
+    click.echo(benchmark.format_results(results))
+
+    if not baseline:
+        return
+    if save_baseline:
+        benchmark.save_baseline(results, baseline)
+        click.echo('baseline saved to %s' % baseline)
+        return
+
+    regressions = benchmark.compare(
+        results, benchmark.load_baseline(baseline), threshold=threshold)
+    for case, stage, before, after in regressions:
+        click.echo('REGRESSION %s %s: %.2f ms -> %.2f ms' % (
+            case, stage, before * 1000, after * 1000))
+    if regressions:
+        sys.exit(1)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+import os
+import threading
+import weakref
+
+from .cache import LRUCache
+
+
+# Every Downloader, so a forked child can drop the sessions it inherited.
+_downloaders = weakref.WeakSet()
+
+
+class DownloadError(Exception):
+    pass
+
+
+class Downloader(object):
+    """ Pooled, keep-alive HTTP client for template downloads.
+
+        Responses are streamed with a size guard, and validators
+        (ETag/Last-Modified) of recent downloads are kept together with
+        their content, so an unchanged URL costs a 304 round trip instead
+        of a full download.
+    """
+
+    def __init__(self, timeout=(3.05, 10), max_bytes=20 * 1024 * 1024,
+                 pool_connections=10, pool_maxsize=10, cache_size=64,
+                 cache_bytes=64 * 1024 * 1024, chunk_size=64 * 1024):
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self._session = None
+        self._session_lock = threading.Lock()
+        self.validators = LRUCache(maxsize=cache_size, maxbytes=cache_bytes,
+                                   sizeof=lambda entry: len(entry['content']))
+        self.revalidated = 0
+        _downloaders.add(self)
+
+    @property
+    def session(self):
+        # requests is imported on the first download, not at import time.
+        with self._session_lock:
+            if self._session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=self.pool_connections,
+                                      pool_maxsize=self.pool_maxsize)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self._session = session
+            return self._session
+
+    def conditional_headers(self, entry):
+        headers = {}
+        if entry is None:
+            return headers
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def read(self, response):
+        length = response.headers.get('Content-Length')
+        if length and length.isdigit() and int(length) > self.max_bytes:
+            raise DownloadError('Response too large: %s bytes' % length)
+
+        content = bytearray()
+        for chunk in response.iter_content(chunk_size=self.chunk_size):
+            content.extend(chunk)
+            if len(content) > self.max_bytes:
+                raise DownloadError('Response exceeded %s bytes' % self.max_bytes)
+        return bytes(content)
+
+    def get(self, url):
+        from requests.exceptions import RequestException
+
+        entry = self.validators.get(url)
+        try:
+            with self.session.get(url,
+                                  headers=self.conditional_headers(entry),
+                                  timeout=self.timeout,
+                                  stream=True) as response:
+                if response.status_code == 304 and entry is not None:
+                    self.revalidated += 1
+                    return entry['content']
+                response.raise_for_status()
+                content = self.read(response)
+                etag = response.headers.get('ETag')
+                last_modified = response.headers.get('Last-Modified')
+        except RequestException as exc:
+            raise DownloadError(str(exc))
+
+        if etag or last_modified:
+            self.validators.put(url, {
+                'etag': etag,
+                'last_modified': last_modified,
+                'content': content,
+            })
+        else:
+            self.validators.pop(url)
+        return content
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    def reset_after_fork(self):
+        # The parent's pooled connections are left alone, closing them here
+        # would close the parent's sockets too.
+        self._session = None
+        self._session_lock = threading.Lock()
+
+
+def reset_after_fork():
+    """ Drop the sessions inherited by a forked child; locks are recreated,
+        another thread may have held them at fork.
+    """
+    for downloader in list(_downloaders):
+        downloader.reset_after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    # Connection pools must not be shared with forked workers.
+    os.register_at_fork(after_in_child=reset_after_fork)
+
+
+downloader = Downloader()
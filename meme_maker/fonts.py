@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+import os
+
+from .cache import LRUCache
+
+
+DEFAULT_FONT_PATH = os.path.join(os.path.dirname(__file__), 'assets/impact.ttf')
+
+
+class FontMetrics(object):
+    """ Per-font table of glyph advance widths measured at a reference size.
+
+        Advances scale linearly with the font size, so the width of a line
+        at any size can be estimated without rasterizing anything. The
+        estimate seeds `fit_size`, which confirms it against real
+        FreeType measurements.
+    """
+    reference_size = 100
+
+    def __init__(self, path, fonts=None):
+        self.path = path
+        self.fonts = fonts or registry
+        self.font = self.fonts.get(path, self.reference_size)
+        self.advances = {}
+
+    def advance(self, char):
+        try:
+            return self.advances[char]
+        except KeyError:
+            width = self.advances[char] = self.font.getlength(char)
+            return width
+
+    def text_width(self, text, size):
+        reference_width = sum(self.advance(char) for char in text)
+        return reference_width * size / float(self.reference_size)
+
+    def measure(self, text, size):
+        return self.fonts.get(self.path, size).getlength(text)
+
+    def fit_size(self, text, width, min_ratio=0.7, max_ratio=0.9,
+                 min_size=12, max_size=70):
+        """ Largest size in [min_size, max_size] whose text to `width` ratio
+            does not exceed `max_ratio`. The ratio only drops below
+            `min_ratio` when `max_size` caps the font.
+        """
+        unit_width = self.text_width(text, 1)
+        if not text or not unit_width:
+            return max_size
+
+        measured = {}
+
+        def fits(size):
+            if size not in measured:
+                measured[size] = self.measure(text, size) <= max_ratio * width
+            return measured[size]
+
+        guess = int(max_ratio * width / unit_width)
+        guess = max(min_size, min(max_size, guess))
+
+        # Closed-form guess is usually exact or off by one, so check its
+        # neighbour first and fall back to bisection only when it is not.
+        if fits(guess):
+            if guess == max_size or not fits(guess + 1):
+                return guess
+            low, high = guess + 1, max_size
+        else:
+            if guess == min_size or fits(guess - 1):
+                return max(guess - 1, min_size)
+            low, high = min_size, guess - 2
+
+        while low < high:
+            middle = (low + high + 1) // 2
+            if fits(middle):
+                low = middle
+            else:
+                high = middle - 1
+
+        return low
+
+
+def truetype(path, size):
+    from PIL import ImageFont
+
+    return ImageFont.truetype(path, size=size)
+
+
+class FontRegistry(object):
+    """ Process-wide registry of loaded FreeType fonts.
+
+        Parsing a font file is expensive, so every (path, size) pair is
+        loaded once and kept in a bounded LRU:
+
+            font = registry.get(DEFAULT_FONT_PATH, 42)
+    """
+
+    def __init__(self, maxsize=256):
+        self.cache = LRUCache(maxsize=maxsize)
+        self.metrics_cache = LRUCache(maxsize=16)
+
+    def get(self, path, size):
+        key = (path, size)
+        return self.cache.get_or_create(
+            key, lambda: truetype(path, size))
+
+    def metrics(self, path):
+        return self.metrics_cache.get_or_create(
+            path, lambda: FontMetrics(path, fonts=self))
+
+    def stats(self):
+        return self.cache.stats()
+
+    def clear(self):
+        self.cache.clear()
+        self.metrics_cache.clear()
+
+
+registry = FontRegistry()
+
+
+def get_font(path, size):
+    return registry.get(path, size)
+
+
+def get_metrics(path):
+    return registry.metrics(path)
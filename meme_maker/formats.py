@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+
+class OutputFormat(object):
+    """ Image encoding settings for stored memes.
+
+            webp = get_format('webp', quality=75)
+            webp.save(image, buffer)
+
+        Only options listed in `supported` are passed to Pillow, so one set
+        of CLI options can be applied to every requested format.
+    """
+
+    def __init__(self, name, extension, content_type, supported, **options):
+        self.name = name
+        self.extension = extension
+        self.content_type = content_type
+        self.supported = supported
+        self.options = options
+
+    def with_options(self, **options):
+        merged = dict(self.options)
+        merged.update(
+            (key, value) for key, value in options.items()
+            if key in self.supported and value is not None
+        )
+        return OutputFormat(self.name, self.extension, self.content_type,
+                            self.supported, **merged)
+
+    @property
+    def animated(self):
+        return self.name in ANIMATED
+
+    def save(self, image, fp):
+        image.save(fp, format=self.name, **self.options)
+
+    def __eq__(self, other):
+        return (isinstance(other, OutputFormat) and
+                (self.name, self.options) == (other.name, other.options))
+
+    def __hash__(self):
+        return hash((self.name, tuple(sorted(self.options.items()))))
+
+    def __str__(self):
+        return '<OutputFormat: {} {}>'.format(self.name, self.options)
+
+
+FORMATS = {
+    'png': OutputFormat(
+        'png', 'png', 'image/png',
+        supported=('compress_level', 'optimize'),
+        compress_level=6
+    ),
+    'jpeg': OutputFormat(
+        'jpeg', 'jpg', 'image/jpeg',
+        supported=('quality', 'progressive', 'optimize'),
+        quality=85, progressive=True, optimize=True
+    ),
+    'webp': OutputFormat(
+        'webp', 'webp', 'image/webp',
+        supported=('quality', 'lossless', 'method'),
+        quality=80, lossless=False, method=4
+    ),
+    'gif': OutputFormat(
+        'gif', 'gif', 'image/gif',
+        supported=('optimize',)
+    ),
+}
+
+# Formats animated templates are encoded to with all their frames; other
+# formats get the captioned first frame.
+ANIMATED = ('gif', 'webp')
+
+ALIASES = {
+    'jpg': 'jpeg',
+}
+
+
+def get_format(name, **options):
+    if isinstance(name, OutputFormat):
+        return name.with_options(**options)
+    name = name.lower()
+    name = ALIASES.get(name, name)
+    try:
+        output_format = FORMATS[name]
+    except KeyError:
+        raise ValueError('Unsupported output format: {}'.format(name))
+    return output_format.with_options(**options)
+
+
+def get_formats(names, **options):
+    return [get_format(name, **options) for name in names]
@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+import io
+
+
+MAX_TEMPLATE_SIZE = (2048, 2048)
+
+
+def decode_image(data, max_size=None):
+    """ Decode image bytes into an RGB image no larger than `max_size`.
+
+        JPEGs are decoded straight at a reduced scale (`Image.draft`);
+        other formats are shrunk with `reduce()` before the final
+        resampling, so large inputs never get a full-resolution RGB copy.
+    """
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(data))
+    if not max_size or (image.width <= max_size[0] and image.height <= max_size[1]):
+        return image.convert('RGB')
+
+    if image.format == 'JPEG':
+        image.draft('RGB', max_size)
+    if image.mode not in ('RGB', 'RGBA', 'L'):
+        image = image.convert('RGB')
+
+    factor = min(image.width // max_size[0], image.height // max_size[1])
+    if factor > 1:
+        image = image.reduce(factor)
+    image.thumbnail(max_size, Image.LANCZOS, reducing_gap=None)
+
+    return image.convert('RGB')
+
+
+def decode_template(data, max_size=None):
+    """`Animation` for animated GIF/WebP data, a decoded RGB image otherwise."""
+    from PIL import Image
+    from .animation import Animation
+
+    if getattr(Image.open(io.BytesIO(data)), 'is_animated', False):
+        return Animation(data, max_size)
+    return decode_image(data, max_size)
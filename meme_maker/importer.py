@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+import csv
+import json
+import logging
+
+from concurrent.futures import ThreadPoolExecutor
+
+from .imaging import MAX_TEMPLATE_SIZE
+from .index import TemplateIndex, indexes
+from .meme import Meme
+from .storage import recognize_storage
+
+
+logger = logging.getLogger('meme.importer')
+
+TEMPLATE_FIELDS = ('name', 'url')
+
+
+def read_templates(stream, format='jsonl'):
+    """Yield (name, url) pairs from a JSONL or CSV stream."""
+    if format == 'csv':
+        rows = csv.DictReader(stream)
+    elif format == 'jsonl':
+        rows = (json.loads(line) for line in stream if line.strip())
+    else:
+        raise ValueError('Unsupported templates format: {}'.format(format))
+
+    for row in rows:
+        yield row.get('name') or None, row.get('url') or None
+
+
+def import_template(name, url, storage, max_size=MAX_TEMPLATE_SIZE):
+    """ Download, downscale and store one template; returns its
+        TemplateEntry, or None when it could not be loaded.
+    """
+    meme = Meme(logging.getLogger('meme'), name, url, '', storage=storage,
+                max_template_size=max_size)
+    meme.set_paths()
+    meme.get_image_from_url()
+    if meme.image is None:
+        return None
+    # The index is written once for the whole import.
+    entry = meme.store_template(index=False)
+    meme.template_cache.put(meme.template_key(), meme.animation or meme.image,
+                            entry.digest)
+    return entry
+
+
+def import_templates(templates, path, workers=8, max_size=MAX_TEMPLATE_SIZE):
+    """ Import (name, url) pairs into the storage at `path`, fetching up to
+        `workers` templates at a time, and merge them into its template
+        index.
+
+        Returns the updated TemplateIndex and the names that failed.
+    """
+    storage = recognize_storage(path, logger)
+    templates = list(templates)
+    imported = TemplateIndex()
+    failed = []
+
+    def run(template):
+        name, url = template
+        if not name or not url:
+            return name, None
+        try:
+            return name, import_template(name, url, storage, max_size)
+        except Exception as exc:
+            logger.error('Unable to import template %s: %s' % (name, exc))
+            return name, None
+
+    logger.info('importing %s templates' % len(templates))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for name, entry in executor.map(run, templates):
+            if entry is None:
+                failed.append(name)
+            else:
+                imported.put(name, entry)
+
+    index = TemplateIndex.load(storage)
+    index.update(imported)
+    index.save(storage)
+    indexes.get(storage).update(imported)
+    return index, failed
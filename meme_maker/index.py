@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+import json
+import logging
+import os
+import threading
+import time
+
+from collections import namedtuple
+
+from .cache import LRUCache
+from .storage import StorageError
+
+
+logger = logging.getLogger('meme.index')
+
+INDEX_DIR = 'me/mplate/'
+INDEX_PATH = INDEX_DIR + 'index.json'
+INDEX_VERSION = 1
+
+# Stored template formats, in the order Meme looks them up.
+TEMPLATE_FORMATS = ('png', 'gif', 'webp')
+
+
+class TemplateEntry(namedtuple('TemplateEntry', [
+        'digest', 'width', 'height', 'format', 'bytes'])):
+    """ Stored template: pixel digest, dimensions, stored format and object
+        size. Entries found by listing the storage have no digest and
+        dimensions until the template is stored or imported again.
+    """
+
+    @property
+    def extension(self):
+        return self.format
+
+
+class TemplateIndex(object):
+    """ Name -> TemplateEntry map of the templates in one storage.
+
+        It is kept as one compact JSON object next to the templates
+        (`me/mplate/index.json`), so a process knows every stored template
+        and its digest after a single read:
+
+            index = TemplateIndex.load(storage)
+            entry = index.get('doge')
+
+        An index becomes `complete` by listing the storage (`refresh`) in
+        this process. Other processes keep storing templates afterwards, so
+        a name missing from a complete index is only likely, not known, to
+        be missing; completeness is never read back from the stored index.
+    """
+
+    def __init__(self, entries=None, complete=False):
+        self.entries = dict(entries or {})
+        self.complete = complete
+        self.recorded = {}
+        self.refreshed_at = None
+        self.refreshing = None
+        self.lock = threading.Lock()
+
+    def get(self, name):
+        return self.entries.get(name)
+
+    def put(self, name, entry):
+        with self.lock:
+            self.entries[name] = entry
+            self.recorded[name] = time.time()
+
+    def update(self, other):
+        with self.lock:
+            self.entries.update(other.entries)
+            now = time.time()
+            for name in other.entries:
+                self.recorded[name] = now
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                'version': INDEX_VERSION,
+                'templates': dict((name, list(entry))
+                                  for name, entry in self.entries.items()),
+            }
+
+    @classmethod
+    def from_dict(cls, data):
+        if data.get('version') != INDEX_VERSION:
+            return cls()
+        return cls((name, TemplateEntry(*entry))
+                   for name, entry in data.get('templates', {}).items())
+
+    @classmethod
+    def load(cls, storage):
+        """Index stored in `storage`, empty when there is none."""
+        try:
+            data = storage.read(storage.path + INDEX_PATH)
+            return cls.from_dict(json.loads(data.decode('utf-8')))
+        except (StorageError, ValueError, TypeError):
+            return cls()
+
+    def save(self, storage):
+        data = json.dumps(self.to_dict(), sort_keys=True, separators=(',', ':'))
+        storage.write(storage.path + INDEX_PATH, data.encode('utf-8'),
+                      'application/json')
+
+    def record(self, storage, name, entry, attempts=3):
+        """ Add a freshly stored template and persist the index, merged with
+            entries other processes stored in the meantime.
+
+            Storages have no compare-and-swap, so a concurrent writer can
+            still replace the stored index; the save is read back and
+            retried when it lost `name`. Entries lost anyway are found again
+            by the next listing of the storage.
+        """
+        self.put(name, entry)
+        for _ in range(attempts):
+            stored = TemplateIndex.load(storage)
+            with self.lock:
+                for other_name, other_entry in stored.entries.items():
+                    self.entries.setdefault(other_name, other_entry)
+            self.save(storage)
+            if name in TemplateIndex.load(storage):
+                return
+        logger.warning('Template %s may be missing from the index of %s' % (name, storage))
+
+    def refresh(self, storage):
+        """ Rebuild the index from a listing of the storage (pages of
+            list_objects_v2 on S3); known entries of unchanged objects are
+            kept, and so are templates recorded while the listing ran.
+            Marks the index complete.
+        """
+        started = time.time()
+        listed = {}
+        for path, size in storage.list(storage.path + INDEX_DIR):
+            name, extension = os.path.splitext(os.path.basename(path))
+            extension = extension.lstrip('.')
+            if extension not in TEMPLATE_FORMATS:
+                continue
+            current = listed.get(name)
+            if current is not None and (TEMPLATE_FORMATS.index(current.format) <
+                                        TEMPLATE_FORMATS.index(extension)):
+                continue
+            listed[name] = TemplateEntry(None, None, None, extension, size)
+
+        with self.lock:
+            changed = not self.complete or set(listed) != set(self.entries)
+            for name, entry in listed.items():
+                known = self.entries.get(name)
+                if known is not None and (known.format, known.bytes) == (entry.format, entry.bytes):
+                    listed[name] = known
+                else:
+                    changed = True
+            for name, recorded_at in list(self.recorded.items()):
+                if recorded_at < started:
+                    del self.recorded[name]
+                elif name in self.entries:
+                    listed.setdefault(name, self.entries[name])
+            self.entries = listed
+            self.complete = True
+            self.refreshed_at = time.time()
+        return changed
+
+    def refresh_async(self, storage, save=True):
+        """Refresh in a background thread (at most one at a time) and persist changes."""
+        with self.lock:
+            if self.refreshing is not None and self.refreshing.is_alive():
+                return self.refreshing
+
+            def run():
+                try:
+                    if self.refresh(storage) and save:
+                        self.save(storage)
+                except StorageError as exc:
+                    logger.error('Unable to refresh template index of %s: %s' % (storage, exc))
+
+            self.refreshing = threading.Thread(target=run, name='meme-index-refresh')
+            self.refreshing.daemon = True
+            self.refreshing.start()
+            return self.refreshing
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class TemplateIndexes(object):
+    """ Template indexes loaded once per storage root and process.
+
+        Indexes that are not complete yet are refreshed from a listing of
+        the storage: local and in-memory storages right away, S3 in the
+        background (with `background`), after which lookups of missing
+        templates need no requests. With `refresh_interval` (seconds)
+        indexes are also refreshed periodically, to pick up templates
+        stored by other processes.
+    """
+
+    def __init__(self, maxsize=64, background=True, refresh_interval=None):
+        self.cache = LRUCache(maxsize=maxsize)
+        self.background = background
+        self.refresh_interval = refresh_interval
+
+    def get(self, storage):
+        index = self.cache.get_or_create(storage.root, lambda: TemplateIndex.load(storage))
+        if self.stale(index):
+            self.refresh(storage, index)
+        return index
+
+    def refresh(self, storage, index):
+        if storage.type == 's3':
+            if self.background:
+                index.refresh_async(storage)
+            return
+        try:
+            index.refresh(storage)
+        except StorageError as exc:
+            logger.error('Unable to list templates of %s: %s' % (storage, exc))
+
+    def stale(self, index):
+        if not index.complete:
+            return True
+        if self.refresh_interval is None:
+            return False
+        return (index.refreshed_at is None or
+                time.time() - index.refreshed_at > self.refresh_interval)
+
+    def put(self, storage, index):
+        self.cache.put(storage.root, index)
+
+    def clear(self):
+        self.cache.clear()
+
+
+def refresh_interval():
+    interval = os.environ.get('MEME_MAKER_INDEX_REFRESH')
+    return float(interval) if interval else None
+
+
+indexes = TemplateIndexes(refresh_interval=refresh_interval())
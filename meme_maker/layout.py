@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+import json
+
+from collections import namedtuple
+
+from .cache import LRUCache
+
+
+class CaptionLayout(namedtuple('CaptionLayout', [
+        'lines', 'font_size', 'width', 'height', 'x', 'y'])):
+    """Wrapped lines of one caption, its font size, metrics and position."""
+
+    @property
+    def text(self):
+        return '\n'.join(self.lines)
+
+
+class TextLayout(object):
+    """ Layout of all captions of a meme for one image size and font.
+
+        Layout is deterministic, so it is computed once per
+        `Meme.layout_key()` and kept in a `LayoutCache`. It serializes to
+        plain dicts, so it can be shared between processes.
+    """
+
+    def __init__(self, captions):
+        self.captions = captions
+
+    def to_dict(self):
+        return {'captions': [caption._asdict() for caption in self.captions]}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls([
+            CaptionLayout(**dict(caption, lines=tuple(caption['lines'])))
+            for caption in data['captions']
+        ])
+
+    def __eq__(self, other):
+        return isinstance(other, TextLayout) and self.captions == other.captions
+
+    def __str__(self):
+        return '<TextLayout: {}>'.format(
+            ' | '.join(caption.text for caption in self.captions))
+
+
+class LayoutCache(object):
+
+    def __init__(self, maxsize=4096):
+        self.cache = LRUCache(maxsize=maxsize)
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def put(self, key, layout):
+        self.cache.put(key, layout)
+
+    def snapshot(self):
+        """List of (key, layout dict) pairs, the inverse of `update`."""
+        return [(key, layout.to_dict()) for key, layout in self.cache.items()]
+
+    def update(self, items):
+        for key, data in items:
+            self.put(freeze(key), TextLayout.from_dict(data))
+
+    def dump(self, fp):
+        json.dump(self.snapshot(), fp)
+
+    def load(self, fp):
+        self.update(json.load(fp))
+
+    def stats(self):
+        return self.cache.stats()
+
+    def clear(self):
+        self.cache.clear()
+
+
+def freeze(value):
+    """Turn JSON lists back into the tuples used in cache keys."""
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+layouts = LayoutCache()
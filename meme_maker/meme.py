@@ -1,103 +1,139 @@
 #!/usr/bin/env python
 
 import hashlib
-import os
 import io
-import requests
-import tempfile
+import json
+import math
+import os
 import textwrap
-import time
-import sys
-
+import threading
+
+from .downloader import DownloadError, downloader as default_downloader
+from .formats import get_format, get_formats
+from .fonts import DEFAULT_FONT_PATH, get_font, get_metrics
+from .metrics import metrics as default_metrics
+from .layout import CaptionLayout, TextLayout, layouts as default_layouts
+from .animation import Animation
+from .imaging import MAX_TEMPLATE_SIZE, decode_template
+from .index import TemplateEntry, indexes as default_indexes
 from .plugins import PluginsLoader
-from PIL import Image, ImageDraw, ImageFont
-
-import boto3
+from .storage import StorageError, recognize_storage
+from .templates import image_digest, templates as default_templates
 
 
 plugins = PluginsLoader()
 plugins.discover()
 
+# Bump whenever drawing changes, so cached renders are not reused.
+RENDER_VERSION = 3
 
-class Storage:
-
-    def __init__(self, logger):
-        self.logger = logger
-        self.type = 'local'
-        self.bucket = None
-        self.path = None
-        self.s3 = None
-
-    def setup_s3_client(self):
-        self.s3 = boto3.client('s3')
-
-    def get_s3_file(self, path):
-        return self.s3.get_object(
-            Bucket=self.bucket,
-            Key=path
-        )['Body'].read()
-
-    def create_dir_structure(self):
-        directories = (
-            'me',
-            'me/me',
-            'me/mplate'
-        )
-
-        for directory in directories:
-            path = os.path.join(self.path, directory)
-            if not os.path.isdir(path):
-                os.makedirs(path)
-
-    def recognize_storage(self, path):
-        if os.path.isdir(path):
-            self.type = 'local'
-            self.path = path
-            self.create_dir_structure()
-            self.logger.info('recognized storage: %s' % self.type)
-            return
-
-        self.setup_s3_client()
-        bucket = path.split('/')[0]
-        path = path.split('/')[1:]
-        path = '/'.join(path) + '/' if path else ''
+_buffers = threading.local()
 
-        try:
-            self.s3.list_objects(
-                Bucket=bucket,
-                Prefix=path
-            )
-        except Exception as e:
-            self.logger.error('Specified path not recognized as local or s3: %s' % e)
-            sys.exit(1)
 
-        self.type = 's3'
-        self.bucket = bucket
-        self.path = path
-        self.logger.info('recognized storage: %s' % self.type)
+def encode_buffer():
+    """Empty per-thread BytesIO reused for every encoded image."""
+    buffer = getattr(_buffers, 'buffer', None)
+    if buffer is None:
+        buffer = _buffers.buffer = io.BytesIO()
+    buffer.seek(0)
+    buffer.truncate()
+    return buffer
 
 
 class Meme:
 
-    def __init__(self, logger, template, url, text):
+    def __init__(self, logger, template, url, text, template_cache=None,
+                 downloader=None, storage=None, formats=None,
+                 max_template_size=MAX_TEMPLATE_SIZE, layout_cache=None,
+                 metrics=None, template_indexes=None):
         self.logger = logger
         self.template_name = template
         self.template_path = None
         self.meme_path = None
+        self.meme_paths = {}
         self.tmp_path = None
         self.url = url
         self.text = text
         self.filetype = 'png'
-        self.storage = Storage(self.logger)
-        self.font_path = os.path.join(os.path.dirname(__file__),
-                                      'assets/impact.ttf')
+        self.formats = get_formats(formats or [self.filetype])
+        self.storage = storage
+        self.font_path = DEFAULT_FONT_PATH
+        self.outline_ratio = 1 / 25.0
+        self.max_template_size = max_template_size
+        self.template_cache = template_cache or default_templates
+        self.downloader = downloader or default_downloader
+        self.layout_cache = layout_cache or default_layouts
+        self.metrics = metrics or default_metrics
+        self.template_indexes = template_indexes or default_indexes
+        self.image = None
+        self.animation = None
+        self.captions = []
+
+    def recognize_storage(self, path):
+        if self.storage is None:
+            self.storage = recognize_storage(path, self.logger)
 
     def set_paths(self):
-        self.template_path = '%sme/mplate/%s.%s' % (
-            self.storage.path, self.template_name, self.filetype)
-        timestamp = int(time.time())
-        self.meme_path = '%sme/me/%s-%s.%s' % (
-            self.storage.path, self.template_name, timestamp, self.filetype)
+        self.template_path = self.get_template_path(self.filetype)
+
+    def get_template_path(self, extension):
+        return '%sme/mplate/%s.%s' % (
+            self.storage.path, self.template_name, extension)
+
+    def template_paths(self):
+        """Stored template candidates, animated templates keep their source format."""
+        return [self.template_path] + [
+            self.get_template_path(extension) for extension in ('gif', 'webp')]
+
+    def template_index(self):
+        return self.template_indexes.get(self.storage)
+
+    def template_entry(self):
+        """Index entry of the template in the storage, None when not indexed."""
+        return self.template_index().get(self.template_name)
+
+    def set_template(self, template):
+        """Use a decoded template; animations are drawn on their first frame."""
+        if isinstance(template, Animation):
+            self.animation = template
+            self.image = template.first_frame()
+        else:
+            self.animation = None
+            self.image = template
+
+    def set_meme_paths(self, template_digest):
+        self.meme_paths = dict(
+            (output_format.name, '%sme/me/%s-%s.%s' % (
+                self.storage.path, self.template_name,
+                self.render_key(template_digest, output_format),
+                output_format.extension))
+            for output_format in self.formats
+        )
+        self.meme_path = self.meme_paths[self.formats[0].name]
+
+    def normalized_text(self):
+        # Only the top and bottom captions are drawn, uppercased and
+        # re-wrapped, so case and whitespace do not change the output.
+        parts = [' '.join(part.split()).upper()
+                 for part in self.text.split('|')[:2]]
+        return '|'.join(parts).rstrip('|')
+
+    def render_options(self):
+        return {
+            'version': RENDER_VERSION,
+            'font': os.path.basename(self.font_path),
+            'outline': self.outline_ratio,
+        }
+
+    def render_key(self, template_digest, output_format):
+        key = json.dumps([
+            template_digest,
+            self.normalized_text(),
+            self.render_options(),
+            output_format.name,
+            output_format.options,
+        ], sort_keys=True)
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
 
     def generate_template_name(self):
         return hashlib.md5(self.url.encode('utf-8')).hexdigest()
@@ -106,115 +142,80 @@ class Meme:
     def get_image_from_url(self):
         self.logger.info('downloading %s' % self.url)
         try:
-            image = requests.get(self.url)
-        except requests.exceptions.RequestException as e:
-            self.logger.error('Unable to retreive URL: %s' % url)
+            with self.metrics.span('download'):
+                content = self.downloader.get(self.url)
+        except DownloadError as e:
+            self.logger.error('Unable to retreive URL %s: %s' % (self.url, e))
+            return
+        self.metrics.incr('bytes.downloaded', len(content))
 
         try:
-            self.image = Image.open(io.BytesIO(image.content)).convert('RGB')
+            with self.metrics.span('decode'):
+                self.set_template(decode_template(content, self.max_template_size))
         except IOError:
             self.logger.error('Given URL doesnt seems to be a proper image')
         except Exception as e:
             self.logger.error('Unable to process the image: %s' % e)
 
-    def store_image(self, path):
+    def store_image(self, path, output_format=None):
         self.logger.info('storing image at %s' % path)
-        tmp_path = '%s.%s' % (tempfile.NamedTemporaryFile().name,
-                              self.filetype)
-
-        self.image.save(tmp_path)
-        if self.storage.type == 'local':
-            self.image.save(path)
-
-        elif self.storage.type == 's3':
-            self.storage.s3.put_object(
-                Bucket=self.storage.bucket,
-                ACL='public-read',
-                Body=open(tmp_path, 'rb'),
-                ContentType='image/%s' % self.filetype,
-                Key=path
-            )
+        output_format = output_format or get_format(self.filetype)
+        buffer = encode_buffer()
+        with self.metrics.span('encode'):
+            if self.animation is not None and output_format.animated:
+                self.animation.save(buffer, output_format, self.captions)
+            else:
+                output_format.save(self.image, buffer)
+        with buffer.getbuffer() as data:
+            with self.metrics.span('upload'):
+                self.storage.write(path, data, output_format.content_type)
+            self.metrics.incr('bytes.uploaded', len(data))
+            return len(data)
+
+    def store_meme(self):
+        for output_format in self.formats:
+            self.store_image(self.meme_paths[output_format.name], output_format)
 
     @plugins.dispatch
     def get_image(self, path):
         self.logger.info('getting image from %s' % path)
-        if self.storage.type == 'local':
-            if not os.path.isfile(self.template_path):
-                return False
-            with open(self.template_path, 'rb') as f:
-                image = f.read()
-        elif self.storage.type == 's3':
-            try:
-                image = self.storage.get_s3_file(path)
-            except Exception as e:
-                self.logger.info('Unable to get image from S3: %s' % e)
-                return False
+        try:
+            with self.metrics.span('read'):
+                image = self.storage.read(path)
+        except StorageError as e:
+            self.logger.info('Unable to get image from %s: %s' % (self.storage, e))
+            return False
+        self.metrics.incr('bytes.read', len(image))
 
-        self.image = Image.open(io.BytesIO(image)).convert('RGB')
+        with self.metrics.span('decode'):
+            self.set_template(decode_template(image, self.max_template_size))
 
         return True
 
-    def find_longest_line(self, text):
-        longest_width = 0
-        longest_line = ''
-        for line in text:
-            width = self.draw.textsize(line, font=ImageFont.truetype(self.font_path, 20))[0]
-            if width > longest_width:
-                longest_width = width
-                longest_line = line
-
-        return longest_line
+    def get_font(self, size):
+        return get_font(self.font_path, size)
 
-    def get_font_measures(self, text, font_size, ratio):
-        measures = {}
-        measures['font'] = ImageFont.truetype(self.font_path, size=font_size)
-        measures['width'] = self.draw.textsize(text, font=measures['font'])[0]
-        measures['ratio'] = measures['width'] / float(self.image.width)
-        measures['ratio_diff'] = abs(ratio - measures['ratio'])
-
-        return measures
+    def find_longest_line(self, text):
+        metrics = get_metrics(self.font_path)
+        if not text:
+            return ''
+        return max(text, key=lambda line: metrics.text_width(line, 1))
 
     def optimize_font(self, text):
         """Fuckin' magnets how do they work"""
-        font_min_size = 12
-        font_max_size = 70
-        font_size_range = range(font_min_size, font_max_size + 1)
-
         longest_text_line = self.find_longest_line(text)
 
         # set min/max ratio of font width to image width
-        min_ratio = 0.7
-        max_ratio = 0.9
-        perfect_ratio = min_ratio + (max_ratio - min_ratio)/2
-        ratio = 0
-
-        while (ratio < min_ratio or ratio > max_ratio) and len(font_size_range) > 2:
-            measures = {
-                'top': self.get_font_measures(
-                           text=longest_text_line,
-                           font_size=font_size_range[-1],
-                           ratio=perfect_ratio
-                       ),
-                'low': self.get_font_measures(
-                           text=longest_text_line,
-                           font_size=font_size_range[0],
-                           ratio=perfect_ratio
-                       )
-            }
-
-            half_index = len(font_size_range)/2
-            if measures['top']['ratio_diff'] < measures['low']['ratio_diff']:
-                closer = 'top'
-                font_size_range = font_size_range[half_index:-1]
-            else:
-                closer = 'low'
-                font_size_range = font_size_range[0:half_index]
-
-            ratio = measures[closer]['ratio']
-            witdh = measures[closer]['width']
-            font = measures[closer]['font']
-
-        width = self.draw.textsize(longest_text_line, font=font)[0]
+        font_size = get_metrics(self.font_path).fit_size(
+            longest_text_line,
+            self.image.width,
+            min_ratio=0.7,
+            max_ratio=0.9,
+            min_size=12,
+            max_size=70
+        )
+        font = self.get_font(font_size)
+        width = font.getlength(longest_text_line)
 
         return font, width
 
@@ -222,16 +223,16 @@ class Meme:
         if text_length <= 32:
             wrapping = 32
         elif text_length > 100:
-            wrapping = 10 + text_length / 3
+            wrapping = 10 + text_length // 3
         elif text_length > 32:
-            wrapping = 5 + text_length / 2
+            wrapping = 5 + text_length // 2
         self.logger.info('wrapping {}'.format(wrapping))
 
         return wrapping
 
     def prepare_text(self, text):
         if not text:
-            return '', 0
+            return '', 0, None
         if type(text) == list:
             text = text[0]
         self.logger.info('preparing meme text: {}'.format(text))
@@ -244,83 +245,232 @@ class Meme:
 
         return text, text_width, font
 
+    def outline_width(self, font):
+        return max(1, int(round(font.size * self.outline_ratio)))
+
     def draw_text(self, xy, text, font):
         self.logger.info('drawing meme text: %s' % text)
-        x = xy[0]
-        y = xy[1]
-
-        o = 1
-
-        xys = (
-            (x+o, y),
-            (x-o, y),
-            (x+o, y+o),
-            (x-o, y-o),
-            (x-o, y+o),
-            (x, y-o),
-            (x, y+o)
-        )
-
-        for xy in xys:
-            self.draw.multiline_text(
-                xy,
-                text,
-                fill='black',
-                font=font,
-                align='center'
-            )
-
+        # FreeType strokes the glyphs while rasterizing, so the black
+        # outline and white fill are drawn in a single pass.
         self.draw.multiline_text(
-            (x, y),
+            xy,
             text,
             fill='white',
             font=font,
-            align='center'
+            align='center',
+            stroke_width=self.outline_width(font),
+            stroke_fill='black'
         )
 
-    def draw_meme(self):
-        self.logger.info('drawing meme')
-        self.draw = ImageDraw.Draw(self.image)
+    def layout_key(self):
+        return (self.normalized_text(), self.image.size, self.font_path,
+                self.outline_ratio)
+
+    def get_layout(self):
+        key = self.layout_key()
+        layout = self.layout_cache.get(key)
+        if layout is None:
+            self.metrics.incr('cache.layout.miss')
+            with self.metrics.span('layout'):
+                layout = self.compute_layout()
+            self.layout_cache.put(key, layout)
+        else:
+            self.metrics.incr('cache.layout.hit')
+        return layout
 
-        margin_xy = (
-            0,
-            self.image.height/18
-        )
+    def compute_layout(self):
+        from PIL import Image, ImageDraw
 
-        text_top = self.text.split('|')[0]
+        # Measured on a scratch image, the template is not drawn on.
+        draw = ImageDraw.Draw(Image.new('RGB', (1, 1)))
+        margin_y = self.image.height/18
+        captions = []
+
+        texts = self.normalized_text().split('|')
+        text_top = texts[0]
         if text_top:
             text_top, text_top_width, top_font = self.prepare_text(text_top)
-            top_xy = (
-                ((self.image.width - text_top_width)/2),
-                (margin_xy[1])
-            )
-            self.draw_text(top_xy, text_top, top_font)
+            captions.append(self.caption_layout(
+                draw, text_top, text_top_width, top_font, margin_y))
 
-        text_bottom = self.text.split('|')[1:]
+        text_bottom = texts[1:]
         if text_bottom:
             text_bottom, text_bottom_width, bottom_font = self.prepare_text(text_bottom)
-            bottom_xy = [
-                ((self.image.width - text_bottom_width)/2),
-                (self.image.height - bottom_font.getsize(text_bottom)[1]*len(text_bottom.split('\n')) - margin_xy[1])
-            ]
-            self.draw_text(bottom_xy, text_bottom, bottom_font)
+            captions.append(self.caption_layout(
+                draw, text_bottom, text_bottom_width, bottom_font, margin_y,
+                bottom=True))
 
-    def make_meme(self, path):
-        self.storage.recognize_storage(path)
-        self.set_paths()
+        return TextLayout(captions)
+
+    def caption_layout(self, draw, text, width, font, margin_y, bottom=False):
+        height = draw.multiline_textbbox(
+            (0, 0), text, font=font, stroke_width=self.outline_width(font))[3]
+        if bottom:
+            y = self.image.height - height - margin_y
+        else:
+            y = margin_y
+        return CaptionLayout(
+            lines=tuple(text.split('\n')),
+            font_size=font.size,
+            width=width,
+            height=height,
+            x=(self.image.width - width)/2,
+            y=y
+        )
 
-        if self.url:
+    def draw_captions(self, layout):
+        """ Draw every caption onto its own transparent RGBA band, just
+            large enough for the outlined text. Returns (band, (x, y))
+            pairs in image coordinates.
+        """
+        from PIL import Image, ImageDraw
+
+        measure = ImageDraw.Draw(Image.new('RGBA', (1, 1)))
+        captions = []
+        for caption in layout.captions:
+            font = self.get_font(caption.font_size)
+            left, top, right, bottom = measure.multiline_textbbox(
+                (caption.x, caption.y), caption.text, font=font, align='center',
+                stroke_width=self.outline_width(font))
+            # Whole-pixel offsets that keep the text origin positive leave
+            # its sub-pixel position, and so its pixels, unchanged.
+            x = int(math.floor(min(left, caption.x))) - 1
+            y = int(math.floor(min(top, caption.y))) - 1
+            size = (int(math.ceil(right)) + 1 - x, int(math.ceil(bottom)) + 1 - y)
+            band = Image.new('RGBA', size, (0, 0, 0, 0))
+            self.draw = ImageDraw.Draw(band)
+            self.draw_text((caption.x - x, caption.y - y), caption.text, font)
+            captions.append((band, (x, y)))
+        return captions
+
+    def compose(self, image, captions):
+        """ Paste caption bands onto the template. Cached templates are
+            shared (and read-only when mapped), so they are copied first;
+            the first frame of an animation is decoded for this meme alone
+            and is drawn on in place.
+        """
+        if self.animation is None or image.mode != 'RGB':
+            if not captions and image.mode == 'RGB':
+                return image
+            image = image.convert('RGB')
+        for band, box in captions:
+            image.paste(band, box, band)
+        return image
+
+    def draw_meme(self):
+        self.logger.info('drawing meme')
+        layout = self.get_layout()
+        with self.metrics.span('draw'):
+            self.captions = self.draw_captions(layout)
+            self.image = self.compose(self.image, self.captions)
+
+    def template_key(self):
+        return (self.storage.root, self.template_name)
+
+    def load_template(self):
+        cache_key = self.template_key()
+        image = self.template_cache.get(cache_key)
+        if image is not None:
+            self.logger.info('using cached template %s' % self.template_name)
+            self.metrics.incr('cache.template.hit')
+            self.set_template(image)
+            return True
+        self.metrics.incr('cache.template.miss')
+
+        # Templates missing from a complete index are downloaded without
+        # probing the storage first. Other processes may have stored them
+        # since the index was listed, so without a URL the storage is
+        # still probed.
+        index = self.template_index()
+        entry = index.get(self.template_name)
+        if entry is not None:
+            paths = [self.get_template_path(entry.extension)]
+        elif index.complete and self.url:
+            paths = []
+        else:
+            paths = self.template_paths()
+
+        digest = None
+        if self.template_name and any(self.get_image(path) for path in paths):
+            pass
+        elif self.url:
             self.get_image_from_url()
-            if not self.template_name:
-                self.generate_template_name()
-            if not self.get_image(self.template_path):
-                self.store_image(self.template_path)
-        elif self.template_name:
-            self.get_image(self.template_path)
+            if self.image is not None:
+                digest = self.store_template().digest
         else:
             self.logger.error('Not enough parameters passed')
 
-        self.draw_meme()
-        self.store_image(self.meme_path)
+        if self.image is None:
+            return False
+
+        self.template_cache.put(cache_key, self.animation or self.image, digest)
+        return True
+
+    def store_template(self, index=True):
+        """ Store the loaded template and, with `index`, record it in the
+            template index. Returns its TemplateEntry.
+        """
+        if self.animation is None:
+            extension = self.filetype
+            size = self.store_image(self.template_path)
+        else:
+            extension = self.animation.extension
+            size = self.animation.nbytes
+            path = self.get_template_path(extension)
+            self.logger.info('storing animated template at %s' % path)
+            with self.metrics.span('upload'):
+                self.storage.write(path, self.animation.data, self.animation.content_type)
+            self.metrics.incr('bytes.uploaded', size)
+
+        width, height = self.image.size
+        entry = TemplateEntry(image_digest(self.animation or self.image),
+                              width, height, extension, size)
+        if index:
+            self.template_index().record(self.storage, self.template_name, entry)
+        return entry
+
+    def prepare_meme(self, path):
+        """ Resolve storage, template and output paths.
+
+            Returns True when the meme still has to be drawn and stored;
+            `meme_path` is None when the template could not be loaded.
+        """
+        self.meme_path = None
+        if self.url and not self.template_name:
+            self.template_name = self.generate_template_name()
+        self.recognize_storage(path)
+        self.set_paths()
+
+        template_digest = self.template_cache.digest(self.template_key())
+        if template_digest is None and self.template_name:
+            entry = self.template_entry()
+            if entry is not None:
+                template_digest = entry.digest
+        if template_digest is None:
+            if not self.load_template():
+                self.logger.error('Unable to load template %s' % self.template_name)
+                return False
+            template_digest = self.template_cache.digest(self.template_key())
+
+        self.set_meme_paths(template_digest)
+        if all(self.storage.exists(meme_path)
+               for meme_path in self.meme_paths.values()):
+            self.logger.info('meme already exists at %s' % self.meme_path)
+            self.metrics.incr('cache.render.hit')
+            return False
+        self.metrics.incr('cache.render.miss')
+
+        if self.image is None and not self.load_template():
+            self.meme_path = None
+            return False
+        return True
+
+    def make_meme(self, path):
+        with self.metrics.span('make_meme'):
+            if not self.prepare_meme(path):
+                return self.meme_path
+
+            self.draw_meme()
+            self.store_meme()
 
         return self.meme_path
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+import logging
+import socket
+import threading
+import time
+
+from contextlib import contextmanager
+
+
+logger = logging.getLogger('meme.metrics')
+
+
+class Metrics(object):
+    """ Timing and counter surface for the render pipeline.
+
+        Every measurement is forwarded to the registered sinks:
+
+            metrics = Metrics([StatsdSink('localhost', 8125)])
+            with metrics.span('draw'):
+                ...
+            metrics.incr('bytes.uploaded', len(data))
+
+        Without sinks measurements are dropped.
+    """
+
+    def __init__(self, sinks=None):
+        self.sinks = list(sinks or [])
+
+    def add_sink(self, sink):
+        self.sinks.append(sink)
+
+    def timing(self, name, seconds):
+        for sink in self.sinks:
+            sink.timing(name, seconds)
+
+    def incr(self, name, value=1):
+        for sink in self.sinks:
+            sink.incr(name, value)
+
+    @contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timing(name, time.perf_counter() - start)
+
+
+class LoggingSink(object):
+
+    def __init__(self, logger=logger, level=logging.INFO):
+        self.logger = logger
+        self.level = level
+
+    def timing(self, name, seconds):
+        self.logger.log(self.level, 'timing %s: %.2f ms' % (name, seconds * 1000))
+
+    def incr(self, name, value):
+        self.logger.log(self.level, 'counter %s: +%s' % (name, value))
+
+
+class StatsdSink(object):
+    """Fire-and-forget StatsD over UDP."""
+
+    def __init__(self, host='localhost', port=8125, prefix='meme'):
+        self.address = (host, port)
+        self.prefix = prefix
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def send(self, payload):
+        try:
+            self.socket.sendto(payload.encode('utf-8'), self.address)
+        except (IOError, OSError) as exc:
+            logger.debug('Unable to send metric %s: %s' % (payload, exc))
+
+    def timing(self, name, seconds):
+        self.send('%s.%s:%.3f|ms' % (self.prefix, name, seconds * 1000))
+
+    def incr(self, name, value):
+        self.send('%s.%s:%s|c' % (self.prefix, name, value))
+
+
+class PrometheusSink(object):
+    """Histograms and counters in a prometheus_client registry (optional dependency)."""
+
+    def __init__(self, registry=None, namespace='meme'):
+        import prometheus_client
+
+        self.client = prometheus_client
+        self.registry = registry or prometheus_client.REGISTRY
+        self.namespace = namespace
+        self.histograms = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def metric_name(self, name):
+        return name.replace('.', '_').replace('-', '_')
+
+    def timing(self, name, seconds):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = self.client.Histogram(
+                    '%s_seconds' % self.metric_name(name),
+                    'Duration of %s' % name,
+                    namespace=self.namespace,
+                    registry=self.registry)
+        histogram.observe(seconds)
+
+    def incr(self, name, value):
+        with self.lock:
+            counter = self.counters.get(name)
+            if counter is None:
+                counter = self.counters[name] = self.client.Counter(
+                    self.metric_name(name),
+                    'Count of %s' % name,
+                    namespace=self.namespace,
+                    registry=self.registry)
+        counter.inc(value)
+
+
+class MemorySink(object):
+    """In-process aggregates, e.g. for tests or a /metrics endpoint."""
+
+    def __init__(self):
+        self.counters = {}
+        self.timings = {}
+        self.lock = threading.Lock()
+
+    def timing(self, name, seconds):
+        with self.lock:
+            count, total = self.timings.get(name, (0, 0.0))
+            self.timings[name] = (count + 1, total + seconds)
+
+    def incr(self, name, value):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'counters': dict(self.counters),
+                'timings': dict(
+                    (name, {'count': count, 'total': total})
+                    for name, (count, total) in self.timings.items()
+                ),
+            }
+
+
+metrics = Metrics()
@@ -1,28 +1,82 @@
 #!/usr/bin/env python
 import os
+import copy
+import json
+import hashlib
+import time
+import atexit
 import logging
 import importlib
+import tempfile
+import threading
 
-import yaml
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from functools import wraps
+
+from ..metrics import metrics
 
 
 logger = logging.getLogger('meme.plugins')
 logger.setLevel(logging.INFO)
 
 
+ALL_EVENTS = '*'
+
+BLOCKING = 'blocking'
+BACKGROUND = 'background'
+MODES = (BLOCKING, BACKGROUND)
+
+
 class Plugin(object):
     def __init__(self):
         self.meta = None
         self.module = None
+        self.module_name = None
+        self._handler = None
+
+    def load_module(self):
+        if self.module is None and self.module_name:
+            logger.info('Importing plugin: {}'.format(self.name))
+            self.module = importlib.import_module(self.module_name)
+        return self.module
 
     @property
     def handler(self):
+        if self._handler is not None:
+            return self._handler
         handler_name = self.meta.get('handler')
         try:
-            return getattr(self.module, handler_name)
+            self.load_module()
+        except ImportError as exc:
+            logger.error('Unable to import plugin {}: {}'.format(self.name, exc))
+            return
+        try:
+            self._handler = getattr(self.module, handler_name)
         except Exception as exc:
             print(exc)
             return
+        return self._handler
+
+    @property
+    def events(self):
+        """Events from plugin.yaml or @subscribe, ALL_EVENTS when undeclared."""
+        events = self.meta.get('events')
+        if events is None:
+            events = getattr(self.handler, 'events', None)
+        return list(events) if events is not None else [ALL_EVENTS]
+
+    @property
+    def mode(self):
+        """BLOCKING (default) runs inline, BACKGROUND is fire-and-forget."""
+        return self.meta.get('mode') or getattr(self.handler, 'mode', None) or BLOCKING
+
+    @property
+    def timeout(self):
+        """Seconds the plugin may take, None for no limit."""
+        timeout = self.meta.get('timeout')
+        if timeout is None:
+            timeout = getattr(self.handler, 'timeout', None)
+        return timeout
 
     @property
     def name(self):
@@ -65,10 +119,12 @@ class PluginMeta(object):
     ]
 
     plugin_meta_optional = [
-        'author', 'email'
+        'author', 'email', 'events', 'mode', 'timeout'
     ]
 
-    def __init__(self, plugin):
+    def __init__(self, plugin, plugins_path=None):
+        if plugins_path:
+            self.plugins_path = plugins_path
         self.plugin_name = plugin
         self.plugin_path = self.get_plugin_path()
         self.meta_path = self.get_meta_path()
@@ -81,9 +137,11 @@ class PluginMeta(object):
         return os.path.join(self.plugin_path, self.default_meta_file)
 
     def get_meta_content(self):
+        import yaml
+
         with open(self.meta_path, 'r') as meta_file:
             try:
-                return yaml.load(meta_file)
+                return yaml.safe_load(meta_file)
             except yaml.YAMLError as exc:
                 raise
 
@@ -93,8 +151,8 @@ class PluginMeta(object):
 
 #TODO: More validation
 class PluginValidator(PluginMeta):
-    def __init__(self, plugin_name):
-        super(PluginValidator, self).__init__(plugin_name)
+    def __init__(self, plugin_name, plugins_path=None):
+        super(PluginValidator, self).__init__(plugin_name, plugins_path)
         self.plugin = Plugin()
         self.errors = []
 
@@ -138,13 +196,37 @@ class PluginValidator(PluginMeta):
             return False
         return True
 
+    def validate_events(self):
+        events = self.meta_content.get('events')
+        if events is None:
+            return True
+        if not isinstance(events, list) or not all(isinstance(event, str) for event in events):
+            self.errors.append('Events must be a list of event names')
+            return False
+        return True
+
+    def validate_mode(self):
+        mode = self.meta_content.get('mode')
+        if mode is not None and mode not in MODES:
+            self.errors.append('Mode must be one of: {}'.format(', '.join(MODES)))
+            return False
+        timeout = self.meta_content.get('timeout')
+        if timeout is not None and (isinstance(timeout, bool) or
+                                    not isinstance(timeout, (int, float)) or
+                                    timeout <= 0):
+            self.errors.append('Timeout must be a positive number of seconds')
+            return False
+        return True
+
     def is_valid(self):
         validators = [
             self.validate_required_fields,
             self.validate_unsupported_fields,
             self.check_meta_file,
             self.validate_script_file,
-            self.validate_handler
+            self.validate_handler,
+            self.validate_events,
+            self.validate_mode
         ]
         for validator in validators:
             if not validator():
@@ -153,6 +235,187 @@ class PluginValidator(PluginMeta):
         return True
 
 
+def default_manifest_path(plugins_path):
+    """ Manifest of `plugins_path` in the user cache directory
+        ($XDG_CACHE_HOME or ~/.cache), or in the temporary directory when
+        that is not writable, e.g. in read-only serverless bundles.
+    """
+    name = 'plugins-%s.json' % hashlib.sha1(
+        os.path.abspath(plugins_path).encode('utf-8')).hexdigest()[:16]
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(
+        os.path.expanduser('~'), '.cache')
+    directory = os.path.join(cache_home, 'meme-maker')
+    try:
+        os.makedirs(directory, exist_ok=True)
+        if os.access(directory, os.W_OK):
+            return os.path.join(directory, name)
+    except OSError:
+        pass
+    return os.path.join(tempfile.gettempdir(), 'meme-maker-%s' % name)
+
+
+class PluginManifest(object):
+    """ JSON index of valid plugin metadata.
+
+        The index is keyed by a signature of the plugins directory (plugin
+        directories and mtimes of their meta files), so plugin.yaml files
+        are parsed again only after something changed.
+    """
+
+    def __init__(self, plugins_path, path):
+        self.plugins_path = plugins_path
+        self.path = path
+
+    def plugin_dirs(self):
+        return sorted(
+            plugin for plugin in os.listdir(self.plugins_path)
+            if os.path.isdir(os.path.join(self.plugins_path, plugin)) and plugin != '__pycache__'
+        )
+
+    def signature(self):
+        signature = []
+        for plugin in self.plugin_dirs():
+            plugin_path = os.path.join(self.plugins_path, plugin)
+            meta_path = os.path.join(plugin_path, PluginMeta.default_meta_file)
+            meta_mtime = os.path.getmtime(meta_path) if os.path.exists(meta_path) else None
+            signature.append([plugin, os.path.getmtime(plugin_path), meta_mtime])
+        return signature
+
+    def read(self, signature):
+        try:
+            with open(self.path, 'r') as manifest_file:
+                manifest = json.load(manifest_file)
+        except (IOError, OSError, ValueError):
+            return None
+        if manifest.get('signature') != signature:
+            return None
+        return manifest.get('plugins')
+
+    def write(self, signature, plugins):
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path), suffix='.tmp')
+            with os.fdopen(fd, 'w') as manifest_file:
+                json.dump({'signature': signature, 'plugins': plugins}, manifest_file)
+            os.replace(tmp_path, self.path)
+        except (IOError, OSError) as exc:
+            logger.warning('Unable to write plugins manifest {}: {}'.format(self.path, exc))
+
+
+class PluginExecutor(object):
+    """ Bounded thread pool for plugin handlers that must not stall rendering.
+
+        At most `queue_size` calls are queued or running; calls above that
+        are dropped. Counters are kept in `stats()` and reported to
+        `metrics` as `plugins.<counter>`:
+
+            submitted, completed, errors, dropped, expired, timeouts
+
+        Python threads can not be interrupted, so a handler running over
+        its timeout is only counted; callers waiting for it stop waiting.
+        Background calls that waited in the queue longer than their timeout
+        are skipped (`expired`).
+    """
+    counters = ('submitted', 'completed', 'errors', 'dropped', 'expired', 'timeouts')
+
+    def __init__(self, workers=2, queue_size=256, metrics=metrics):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.metrics = metrics
+        self.pending = 0
+        self.executor = None
+        self.condition = threading.Condition()
+        self.totals = dict((counter, 0) for counter in self.counters)
+
+    def count(self, counter, plugin_name=None):
+        with self.condition:
+            self.totals[counter] += 1
+        self.metrics.incr('plugins.{}'.format(counter))
+        if plugin_name:
+            self.metrics.incr('plugins.{}.{}'.format(plugin_name, counter))
+
+    def submit(self, plugin, context, timeout=None, background=True, started=None):
+        """ Schedule `plugin.handler(context)`; returns a future or None when
+            dropped. Callers waiting for the future (`background=False`)
+            count their own timeouts; the `started` event is set right
+            before the handler runs.
+        """
+        with self.condition:
+            if self.pending >= self.queue_size:
+                accepted = False
+            else:
+                accepted = True
+                self.pending += 1
+                if self.executor is None:
+                    self.executor = ThreadPoolExecutor(
+                        max_workers=self.workers, thread_name_prefix='meme-plugins')
+        if not accepted:
+            logger.warning('Plugin queue full, dropping {} for {}'.format(
+                plugin.name, context.event))
+            self.count('dropped', plugin.name)
+            return None
+        self.count('submitted', plugin.name)
+        return self.executor.submit(self.run, plugin, context, timeout,
+                                    background, time.perf_counter(), started)
+
+    def run(self, plugin, context, timeout, background, submitted, started=None):
+        try:
+            if background and timeout is not None and time.perf_counter() - submitted > timeout:
+                # Waited in the queue longer than the plugin may run at all.
+                self.count('expired', plugin.name)
+                return
+            if started is not None:
+                started.set()
+            start = time.perf_counter()
+            try:
+                result = plugin.handler(context)
+            except Exception as exc:
+                logger.error('Plugin {} failed on {}: {}'.format(plugin.name, context.event, exc))
+                self.count('errors', plugin.name)
+                return {'exception': exc}
+            if background and timeout is not None and time.perf_counter() - start > timeout:
+                self.count('timeouts', plugin.name)
+            self.count('completed', plugin.name)
+            return {'response': result}
+        finally:
+            with self.condition:
+                self.pending -= 1
+                self.condition.notify_all()
+
+    def cancel(self, future, plugin_name):
+        """Skip a call that has not started yet; False when it is already running."""
+        if not future.cancel():
+            return False
+        with self.condition:
+            self.pending -= 1
+            self.condition.notify_all()
+        self.count('expired', plugin_name)
+        return True
+
+    def flush(self, timeout=None):
+        """Wait for queued calls; returns False if `timeout` passed first."""
+        deadline = time.perf_counter() + timeout if timeout is not None else None
+        with self.condition:
+            while self.pending:
+                remaining = deadline - time.perf_counter() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+        return True
+
+    def shutdown(self, timeout=None):
+        flushed = self.flush(timeout)
+        if self.executor is not None:
+            self.executor.shutdown(wait=flushed)
+            self.executor = None
+        return flushed
+
+    def stats(self):
+        with self.condition:
+            stats = dict(self.totals)
+            stats['pending'] = self.pending
+        return stats
+
+
 class PluginContext(object):
     def __init__(self, meme, handler, args, kwargs):
         self.meme = meme
@@ -160,6 +423,7 @@ class PluginContext(object):
         self.args = args
         self.kwargs = kwargs
         self.logger = logger
+        self.metrics = getattr(meme, 'metrics', None)
 
         self.result = None
         self.event = None
@@ -185,32 +449,110 @@ class PluginsLoader(PluginMeta):
                 ...
 
         Receive event:
+            @subscribe(['post_some_meme_method'])
             def some_plugin_method(context):
                 context.logger.info(context.to_dict())
-    """
 
-    def __init__(self):
+        Subscriptions (`events` in plugin.yaml or @subscribe) are compiled
+        into an event -> handlers table on load, so events nobody
+        subscribed to cost a single dict lookup.
+
+        `discover()` only marks plugins for loading; they are loaded on the
+        first dispatch, from the manifest when it is up to date. Plugins
+        declaring `events` in plugin.yaml are imported when one of their
+        events fires for the first time.
+
+        Plugins run inline by default. `mode: background` (or
+        @subscribe(..., mode=BACKGROUND)) hands events to a bounded
+        PluginExecutor and rendering continues right away; `timeout`
+        bounds how long rendering waits for a blocking plugin, or how long
+        a background call may wait in the queue. Background calls are
+        flushed at exit.
+
+        Blocking plugins with a timeout run on their own executor, so they
+        never queue behind background calls, and their timeout counts from
+        the moment the handler starts; they wait at most `start_timeout`
+        seconds for a free thread.
+    """
+    flush_timeout = 5
+    start_timeout = 30
+
+    def __init__(self, plugins_path=None, manifest_path=None, executor=None,
+                 blocking_executor=None):
+        if plugins_path:
+            self.plugins_path = plugins_path
+        # Resolved on load, see default_manifest_path.
+        self.manifest_path = (
+            manifest_path or
+            os.environ.get('MEME_MAKER_PLUGINS_MANIFEST')
+        )
         self.plugins = {}
+        self.routes = {}
+        self.wildcard = []
+        self.pending = False
+        self.lock = threading.Lock()
+        self.executor = executor or PluginExecutor()
+        self.blocking_executor = blocking_executor or PluginExecutor(workers=8, queue_size=64)
+        atexit.register(self.flush)
 
     def handle(self, plugin_name, context):
         plugin = self.plugins.get(plugin_name)
         if not plugin:
             return {'error': 'Plugin {} not found'.format(plugin_name)}
+
+        timeout = plugin.timeout
+        if plugin.mode == BACKGROUND:
+            # Later events reuse the context, so the task gets its own copy.
+            future = self.executor.submit(plugin, copy.copy(context), timeout)
+            return {'submitted': future is not None}
+
+        if timeout is not None:
+            started = threading.Event()
+            future = self.blocking_executor.submit(plugin, context, timeout,
+                                                   background=False, started=started)
+            if future is not None:
+                if (not started.wait(self.start_timeout) and
+                        self.blocking_executor.cancel(future, plugin.name)):
+                    logger.warning('Plugin {} did not start within {}s on {}'.format(
+                        plugin.name, self.start_timeout, context.event))
+                    return {'error': 'timeout'}
+                try:
+                    return future.result(timeout)
+                except TimeoutError:
+                    logger.warning('Plugin {} timed out after {}s on {}'.format(
+                        plugin.name, timeout, context.event))
+                    self.blocking_executor.count('timeouts', plugin.name)
+                    return {'error': 'timeout'}
+
         try:
             return {'response': plugin.handler(context)}
         except Exception as exc:
+            logger.error('Plugin {} failed on {}: {}'.format(plugin.name, context.event, exc))
+            self.executor.count('errors', plugin.name)
             return {'exception': exc}
 
+    def flush(self, timeout=None):
+        """Wait for background plugin calls, at most `flush_timeout` seconds by default."""
+        return self.executor.flush(self.flush_timeout if timeout is None else timeout)
+
     def discover(self):
         if not os.path.exists(self.plugins_path):
-            logger.error('Unable to resolve plugins path: {}'.format(plugins_path))
+            logger.error('Unable to resolve plugins path: {}'.format(self.plugins_path))
             return
-        self.load()
+        self.pending = True
+
+    def ensure_loaded(self):
+        if not self.pending:
+            return
+        with self.lock:
+            if self.pending:
+                self.load()
+                self.pending = False
 
     def __prepare(self, plugins):
         for plugin in plugins:
             logger.info('Checking plugin: {}'.format(plugin))
-            plugin_validator = PluginValidator(plugin)
+            plugin_validator = PluginValidator(plugin, self.plugins_path)
 
             if plugin_validator.is_valid():
                 yield plugin_validator.plugin
@@ -220,36 +562,75 @@ class PluginsLoader(PluginMeta):
                     logger.error(error)
 
     def load(self):
-        plugins = [plugin
-            for plugin in os.listdir(self.plugins_path)
-            if os.path.isdir(os.path.join(self.plugins_path, plugin)) and plugin != '__pycache__'
-        ]
+        manifest = PluginManifest(self.plugins_path, self.manifest_path or
+                                  default_manifest_path(self.plugins_path))
+        signature = manifest.signature()
+        metas = manifest.read(signature)
+        if metas is None:
+            metas = [plugin.meta for plugin in self.__prepare(manifest.plugin_dirs())]
+            manifest.write(signature, metas)
+
         try:
-            for plugin in self.__prepare(plugins):
-                plugin.module = importlib.import_module('.'.join([__name__, plugin.name, plugin.script]))
+            for meta in metas:
+                plugin = Plugin()
+                plugin.meta = meta
+                plugin.module_name = '.'.join([__name__, plugin.name, plugin.script])
+                if 'events' not in meta:
+                    # Subscriptions are only known from @subscribe.
+                    plugin.load_module()
                 self.plugins[plugin.name] = plugin
         except ImportError as exc:
             logger.error('Unable to load plugins: {}'.format(exc))
-
-    def _dispatch_event(self, context, event):
-        for plugin in self.plugins:
-            context.event = '{}_{}'.format(event, context.handler.__name__)
+        self.compile_routes()
+
+    def compile_routes(self):
+        routes = {}
+        for name, plugin in sorted(self.plugins.items()):
+            for event in plugin.events:
+                routes.setdefault(event, []).append(name)
+        wildcard = routes.pop(ALL_EVENTS, [])
+        self.routes = dict(
+            (event, names + [name for name in wildcard if name not in names])
+            for event, names in routes.items()
+        )
+        self.wildcard = wildcard
+
+    def subscribers(self, event):
+        self.ensure_loaded()
+        return self.routes.get(event) or self.wildcard
+
+    def _dispatch_event(self, context, event, subscribers):
+        context.event = event
+        for plugin in subscribers:
             self.handle(plugin, context)
 
     def dispatch(self, handler):
+        pre_event = 'pre_{}'.format(handler.__name__)
+        post_event = 'post_{}'.format(handler.__name__)
+
+        @wraps(handler)
         def wrapper(meme, *args, **kwargs):
+            pre = self.subscribers(pre_event)
+            post = self.subscribers(post_event)
+            if not pre and not post:
+                return handler(meme, *args, **kwargs)
+
             context = PluginContext(meme, handler, args, kwargs)
-            self._dispatch_event(context, 'pre')
+            self._dispatch_event(context, pre_event, pre)
             context.result = handler(meme, *args, **kwargs)
-            self._dispatch_event(context, 'post')
+            self._dispatch_event(context, post_event, post)
             return context.result
         return wrapper
 
 
-def subscribe(events):
+def subscribe(events, mode=None, timeout=None):
     def real_decorator(fn):
+        @wraps(fn)
         def wrapper(context):
             if context.event in events:
                 return fn(context)
+        wrapper.events = list(events)
+        wrapper.mode = mode
+        wrapper.timeout = timeout
         return wrapper
-    return real_decorator
\ No newline at end of file
+    return real_decorator
@@ -0,0 +1,364 @@
+#!/usr/bin/env python
+import json
+import logging
+import os
+import shutil
+import signal
+import socket
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from .downloader import DownloadError
+from .fonts import DEFAULT_FONT_PATH, get_metrics, registry
+from .index import indexes
+from .layout import layouts
+from .meme import Meme, plugins
+from .metrics import MemorySink, metrics
+from .storage import StorageError, recognize_storage
+from .templates import shared_directory, templates
+
+
+logger = logging.getLogger('meme.server')
+
+# Exit status of a worker that could not warm up.
+WORKER_START_FAILED = 3
+# Workers exiting sooner than MIN_WORKER_UPTIME seconds count as failures;
+# they are restarted after an exponential backoff, up to MAX_RESTARTS in a row.
+MIN_WORKER_UPTIME = 10
+RESTART_BACKOFF = 0.5
+MAX_RESTART_BACKOFF = 30
+MAX_RESTARTS = 5
+
+
+class WorkerError(Exception):
+    pass
+
+
+class MemeRequestHandler(BaseHTTPRequestHandler):
+    """ Routes of the render server:
+
+            GET  /healthz                       liveness of the worker
+            GET  /metrics                       worker metrics and cache stats
+            GET  /meme?meme=&url=&text=         render a meme
+            POST /meme {"meme", "url", "text"}  render a meme
+    """
+    server_version = 'meme-maker'
+
+    def log_message(self, format, *args):
+        logger.debug('%s %s' % (self.address_string(), format % args))
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/healthz':
+            self.send_json(200, {'status': 'ok', 'pid': os.getpid()})
+        elif url.path == '/metrics':
+            self.send_json(200, self.server.snapshot())
+        elif url.path == '/meme':
+            query = parse_qs(url.query)
+            self.render(dict((key, values[0]) for key, values in query.items()))
+        else:
+            self.send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        if urlparse(self.path).path != '/meme':
+            self.send_json(404, {'error': 'not found'})
+            return
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            job = json.loads(self.rfile.read(length).decode('utf-8') or '{}')
+        except ValueError:
+            self.send_json(400, {'error': 'invalid JSON body'})
+            return
+        self.render(job)
+
+    def render(self, job):
+        if not job.get('meme') and not job.get('url'):
+            self.send_json(400, {'error': 'meme or url is required'})
+            return
+        try:
+            path = self.server.make_meme(job)
+        except (StorageError, DownloadError) as exc:
+            self.send_json(502, {'error': str(exc)})
+            return
+        if path is None:
+            self.send_json(422, {'error': 'unable to render meme'})
+            return
+        self.send_json(200, {'path': path})
+
+
+class MemeHTTPServer(HTTPServer):
+    """ HTTP server rendering memes with warm fonts, templates, layouts,
+        plugins and storage clients.
+
+        Requests are handled by a pool of `threads`; up to `queue_size`
+        more wait for a free thread, and everything above that is answered
+        with 503 right away instead of piling up in the accept backlog.
+        GET /healthz and /metrics skip that admission. Requests above the
+        queue size are told from probes and rejected in short-lived threads
+        (at most `max_overflow` at a time), so the accept loop never waits
+        for a client.
+    """
+    probe_paths = (b'/healthz', b'/metrics')
+    probe_timeout = 0.5
+    max_overflow = 64
+
+    def __init__(self, address, path, formats=None, threads=4, queue_size=16,
+                 handler=MemeRequestHandler, bind_and_activate=True):
+        HTTPServer.__init__(self, address, handler, bind_and_activate)
+        self.path = path
+        self.formats = formats
+        self.threads = threads
+        self.max_pending = threads + queue_size
+        self.pending = 0
+        self.lock = threading.Lock()
+        self.overflow = threading.BoundedSemaphore(self.max_overflow)
+        self.executor = None
+        self.storage = None
+        self.sink = MemorySink()
+        self.logger = logging.getLogger('meme')
+
+    def warm(self):
+        """Load everything a render needs; called in every worker process."""
+        self.executor = ThreadPoolExecutor(max_workers=self.threads)
+        self.storage = recognize_storage(self.path, self.logger)
+        indexes.get(self.storage)
+        plugins.ensure_loaded()
+        get_metrics(DEFAULT_FONT_PATH)
+        if self.sink not in metrics.sinks:
+            metrics.add_sink(self.sink)
+
+    def make_meme(self, job):
+        meme = Meme(self.logger, job.get('meme'), job.get('url'),
+                    job.get('text') or '', storage=self.storage,
+                    formats=self.formats)
+        return meme.make_meme(self.path)
+
+    def snapshot(self):
+        return {
+            'pid': os.getpid(),
+            'pending': self.pending,
+            'metrics': self.sink.snapshot(),
+            'caches': {
+                'templates': templates.stats(),
+                'layouts': layouts.stats(),
+                'fonts': registry.stats(),
+            },
+        }
+
+    def is_probe(self, request, timeout):
+        """ Peek at the request line, without consuming it, to tell health
+            and metrics probes from renders; `timeout` 0 does not wait.
+        """
+        try:
+            request.settimeout(timeout)
+            head = request.recv(64, socket.MSG_PEEK)
+        except OSError:
+            return False
+        finally:
+            request.settimeout(None)
+        parts = head.split(b' ', 2)
+        return (len(parts) > 1 and parts[0] == b'GET' and
+                parts[1].split(b'?')[0] in self.probe_paths)
+
+    def start_thread(self, target, *args):
+        thread = threading.Thread(target=target, args=args)
+        thread.daemon = True
+        thread.start()
+
+    def process_probe(self, request, client_address):
+        """Answer probes in their own thread, outside admission and the render pool."""
+        self.start_thread(self.process_request_thread, request, client_address, False)
+
+    def process_overflow(self, request, client_address):
+        try:
+            # The probe may have been accepted before its request line arrived.
+            if self.is_probe(request, self.probe_timeout):
+                self.process_request_thread(request, client_address, False)
+            else:
+                self.reject(request)
+        finally:
+            self.overflow.release()
+
+    def process_request(self, request, client_address):
+        if self.executor is None:
+            self.warm()
+        # A busy but healthy worker still answers its probes.
+        if self.is_probe(request, 0):
+            self.process_probe(request, client_address)
+            return
+        with self.lock:
+            accepted = self.pending < self.max_pending
+            if accepted:
+                self.pending += 1
+        if accepted:
+            self.executor.submit(self.process_request_thread, request, client_address)
+        elif self.overflow.acquire(blocking=False):
+            self.start_thread(self.process_overflow, request, client_address)
+        else:
+            self.reject(request, drain=False)
+
+    def process_request_thread(self, request, client_address, admitted=True):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            if admitted:
+                with self.lock:
+                    self.pending -= 1
+
+    def reject(self, request, drain=True):
+        metrics.incr('server.rejected')
+        try:
+            request.sendall(b'HTTP/1.1 503 Service Unavailable\r\n'
+                            b'Retry-After: 1\r\n'
+                            b'Content-Length: 0\r\n'
+                            b'Connection: close\r\n\r\n')
+            if drain:
+                self.drain(request)
+        except OSError:
+            pass
+        self.shutdown_request(request)
+
+    def drain(self, request):
+        """ Read what is left of a rejected request for at most
+            `probe_timeout`; closing with an unread request body resets the
+            connection before the client reads the 503.
+        """
+        request.shutdown(socket.SHUT_WR)
+        deadline = time.time() + self.probe_timeout
+        while time.time() < deadline:
+            request.settimeout(max(0.01, deadline - time.time()))
+            if not request.recv(65536):
+                break
+
+    def server_close(self):
+        HTTPServer.server_close(self)
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+        if self.sink in metrics.sinks:
+            metrics.sinks.remove(self.sink)
+
+
+def serve(host, port, path, workers=1, threads=4, queue_size=16, formats=None):
+    """ Serve on `host:port` with `workers` pre-forked processes sharing
+        one listening socket. Workers that die are replaced.
+
+        Workers also share decoded templates: one worker decodes a template
+        into the template cache directory and the others map it.
+    """
+    server = MemeHTTPServer((host, port), path, formats=formats,
+                            threads=threads, queue_size=queue_size)
+    logger.info('serving on http://%s:%s with %s workers' % (
+        host, server.server_address[1], workers))
+
+    if workers <= 1:
+        try:
+            server.warm()
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+        return
+
+    children = {}
+    temporary = None
+    if templates.directory is None:
+        templates.directory = temporary = shared_directory()
+
+    def run_worker():
+        try:
+            server.warm()
+        except Exception as exc:
+            logger.error('worker %s failed to start: %s' % (os.getpid(), exc))
+            return WORKER_START_FAILED
+
+        def stop_worker(signum, frame):
+            # shutdown() waits for serve_forever, which runs in this thread.
+            thread = threading.Thread(target=server.shutdown)
+            thread.daemon = True
+            thread.start()
+
+        signal.signal(signal.SIGTERM, stop_worker)
+        try:
+            server.serve_forever()
+        except Exception:
+            logger.exception('worker %s failed' % os.getpid())
+            return 1
+        finally:
+            # Let in-flight renders finish; os._exit skips atexit, so
+            # background plugins are flushed here.
+            server.server_close()
+            plugins.flush()
+        return 0
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            # The parent stops workers with SIGTERM, also on Ctrl-C.
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            status = 1
+            try:
+                status = run_worker()
+            finally:
+                os._exit(status)
+        children[pid] = time.time()
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+
+    previous_handler = signal.signal(signal.SIGTERM, stop)
+    for _ in range(workers):
+        spawn()
+    failures = 0
+    try:
+        while True:
+            pid, status = os.wait()
+            status = os.waitstatus_to_exitcode(status)
+            uptime = time.time() - children.pop(pid, 0)
+            if status == WORKER_START_FAILED or uptime < MIN_WORKER_UPTIME:
+                failures += 1
+            else:
+                failures = 0
+            if failures > MAX_RESTARTS:
+                logger.error('worker %s exited with status %s, %s failures in a row, '
+                             'giving up' % (pid, status, failures))
+                raise WorkerError('workers keep exiting (last status %s)' % status)
+            delay = min(RESTART_BACKOFF * 2 ** (failures - 1), MAX_RESTART_BACKOFF) if failures else 0
+            logger.warning('worker %s exited with status %s, restarting in %.1fs' % (
+                pid, status, delay))
+            time.sleep(delay)
+            spawn()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+        for pid in children:
+            try:
+                os.waitpid(pid, 0)
+            except OSError:
+                pass
+        server.socket.close()
+        signal.signal(signal.SIGTERM, previous_handler)
+        if temporary is not None:
+            shutil.rmtree(temporary, ignore_errors=True)
+            templates.directory = None
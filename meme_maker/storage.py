@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+import io
+import os
+import tempfile
+import threading
+
+
+def current_umask():
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+# mkstemp creates files readable by their owner only; written files get the
+# mode a plain open() would have given them.
+FILE_MODE = 0o666 & ~current_umask()
+
+
+class StorageError(Exception):
+    pass
+
+
+class StorageBackend(object):
+    """ Base class for meme storages.
+
+        Paths passed to backends are full paths/keys built on top of
+        `self.path` (see `Meme.set_paths`).
+    """
+    type = None
+
+    def __init__(self, path):
+        self.path = path
+
+    @property
+    def root(self):
+        return '%s:%s' % (self.type, self.path)
+
+    def exists(self, path):
+        raise NotImplementedError
+
+    def read(self, path):
+        raise NotImplementedError
+
+    def write(self, path, data, content_type):
+        raise NotImplementedError
+
+    def list(self, prefix):
+        """Yield (path, size) of every object under `prefix`."""
+        raise NotImplementedError
+
+    def __str__(self):
+        return '<{}: {}>'.format(self.__class__.__name__, self.root)
+
+
+class LocalStorage(StorageBackend):
+    type = 'local'
+
+    directories = (
+        'me',
+        'me/me',
+        'me/mplate'
+    )
+
+    def __init__(self, path):
+        super(LocalStorage, self).__init__(path)
+        self.create_dir_structure()
+
+    def create_dir_structure(self):
+        for directory in self.directories:
+            path = os.path.join(self.path, directory)
+            if not os.path.isdir(path):
+                os.makedirs(path)
+
+    def exists(self, path):
+        return os.path.isfile(path)
+
+    def read(self, path):
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except (IOError, OSError) as exc:
+            raise StorageError(str(exc))
+
+    def write(self, path, data, content_type):
+        # Write next to the target and rename, so readers never see a
+        # partially written image.
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.',
+                                        prefix='.', suffix='.tmp')
+        try:
+            os.fchmod(fd, FILE_MODE)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def list(self, prefix):
+        try:
+            entries = list(os.scandir(prefix))
+        except (IOError, OSError) as exc:
+            raise StorageError(str(exc))
+        for entry in entries:
+            if entry.is_file() and not entry.name.startswith('.'):
+                yield os.path.join(prefix, entry.name), entry.stat().st_size
+
+
+class MemoryStorage(StorageBackend):
+    type = 'memory'
+
+    def __init__(self, path=''):
+        super(MemoryStorage, self).__init__(path)
+        self.objects = {}
+
+    def exists(self, path):
+        return path in self.objects
+
+    def read(self, path):
+        try:
+            return self.objects[path]['data']
+        except KeyError:
+            raise StorageError('No such object: %s' % path)
+
+    def write(self, path, data, content_type):
+        self.objects[path] = {'data': bytes(data), 'content_type': content_type}
+
+    def list(self, prefix):
+        for path, item in list(self.objects.items()):
+            if path.startswith(prefix):
+                yield path, len(item['data'])
+
+
+_s3_client = None
+_s3_lock = threading.Lock()
+
+
+def get_s3_client():
+    """S3 client shared by the whole process (boto3 clients are thread-safe)."""
+    global _s3_client
+    with _s3_lock:
+        if _s3_client is None:
+            import boto3
+
+            _s3_client = boto3.client('s3')
+        return _s3_client
+
+
+def reset_s3_client():
+    global _s3_client
+    _s3_client = None
+
+
+class S3Storage(StorageBackend):
+    type = 's3'
+
+    multipart_threshold = 8 * 1024 * 1024
+
+    def __init__(self, bucket, path, client=None):
+        from botocore.exceptions import ClientError
+
+        super(S3Storage, self).__init__(path)
+        self.bucket = bucket
+        self.s3 = client or get_s3_client()
+        self.client_error = ClientError
+
+    @property
+    def transfer_config(self):
+        from boto3.s3.transfer import TransferConfig
+
+        return TransferConfig(multipart_threshold=self.multipart_threshold,
+                              multipart_chunksize=self.multipart_threshold)
+
+    @property
+    def root(self):
+        return 's3:%s/%s' % (self.bucket, self.path)
+
+    def probe(self):
+        self.s3.list_objects_v2(Bucket=self.bucket, Prefix=self.path, MaxKeys=1)
+
+    def exists(self, path):
+        try:
+            self.s3.head_object(Bucket=self.bucket, Key=path)
+        except self.client_error:
+            return False
+        return True
+
+    def read(self, path):
+        try:
+            return self.s3.get_object(
+                Bucket=self.bucket,
+                Key=path
+            )['Body'].read()
+        except self.client_error as exc:
+            raise StorageError(str(exc))
+
+    def write(self, path, data, content_type):
+        extra_args = {
+            'ACL': 'public-read',
+            'ContentType': content_type,
+        }
+        if len(data) < self.multipart_threshold:
+            if not isinstance(data, (bytes, bytearray)):
+                data = bytes(data)
+            self.s3.put_object(Bucket=self.bucket, Key=path, Body=data, **extra_args)
+            return
+        self.s3.upload_fileobj(io.BytesIO(data), self.bucket, path,
+                               ExtraArgs=extra_args, Config=self.transfer_config)
+
+    def list(self, prefix):
+        paginator = self.s3.get_paginator('list_objects_v2')
+        try:
+            for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+                for item in page.get('Contents', []):
+                    yield item['Key'], item['Size']
+        except self.client_error as exc:
+            raise StorageError(str(exc))
+
+
+_recognized = {}
+_recognized_lock = threading.Lock()
+
+
+def recognize_storage(path, logger):
+    """ Return the storage backend for `path`, a local directory or
+        `bucket[/prefix]` on S3. S3 backends are cached per path, so the
+        bucket is probed once per process.
+    """
+    if os.path.isdir(path):
+        logger.info('recognized storage: local')
+        return LocalStorage(path)
+
+    with _recognized_lock:
+        storage = _recognized.get(path)
+        if storage is None:
+            bucket = path.split('/')[0]
+            prefix = path.split('/')[1:]
+            prefix = '/'.join(prefix) + '/' if prefix else ''
+            storage = S3Storage(bucket, prefix)
+            try:
+                storage.probe()
+            except Exception as e:
+                logger.error('Specified path not recognized as local or s3: %s' % e)
+                raise StorageError(str(e))
+            _recognized[path] = storage
+
+    logger.info('recognized storage: %s' % storage.type)
+    return storage
+
+
+def forget_storages():
+    with _recognized_lock:
+        _recognized.clear()
+
+
+def reset_after_fork():
+    """ Forget the S3 client and the backends holding it in a forked child;
+        locks are recreated, another thread may have held them at fork.
+    """
+    global _s3_lock, _recognized_lock
+    _s3_lock = threading.Lock()
+    _recognized_lock = threading.Lock()
+    reset_s3_client()
+    forget_storages()
+
+
+if hasattr(os, 'register_at_fork'):
+    # Connection pools must not be shared with forked workers.
+    os.register_at_fork(after_in_child=reset_after_fork)
@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+import binascii
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+
+from .animation import Animation
+from .cache import LRUCache
+
+
+# Decoded templates handed from a parent to its worker processes go to
+# tmpfs when there is one, so mapping them never touches the disk.
+SHARED_DIR = '/dev/shm'
+
+# Bound of the disk tier; tmpfs is never evicted, so a shared directory on
+# /dev/shm would otherwise grow with every distinct template until restart.
+DISK_MAXBYTES = 1024 * 1024 * 1024
+
+
+def image_nbytes(image):
+    if isinstance(image, Animation):
+        return image.nbytes
+    return image.width * image.height * len(image.getbands())
+
+
+def image_digest(image):
+    if isinstance(image, Animation):
+        return image.digest()
+    return hashlib.sha1(image.tobytes()).hexdigest()
+
+
+def shared_directory():
+    """New directory for a TemplateCache disk tier shared by worker processes."""
+    return tempfile.mkdtemp(prefix='meme-templates-',
+                            dir=SHARED_DIR if os.path.isdir(SHARED_DIR) else None)
+
+
+class TemplateCache(object):
+    """ Two-tier cache of decoded RGB templates.
+
+        The memory tier is an LRU bounded by decoded pixel bytes. The
+        optional disk tier keeps raw RGB pixels (no PNG decode needed) in
+        `directory`, so warm templates survive process restarts:
+
+            templates = TemplateCache(directory='/var/cache/meme-maker')
+            image = templates.get(key)
+
+        Disk tier files are memory-mapped and wrapped by read-only RGBX
+        images without a copy (Pillow keeps RGB pixels in 4 bytes, so they
+        are stored padded), so processes sharing a directory share one copy
+        of the pixels in the page cache; a parent can decode templates once
+        for all of its workers. The pixel digest is kept in the file header.
+        The disk tier is bounded by `disk_maxbytes`: reads touch the mtime
+        of a file and writes unlink the least recently used files past the
+        bound (processes already mapping them keep their pixels).
+
+        Animated templates are kept as their encoded `Animation`.
+        Cached images are shared and must not be drawn on; take a writable
+        copy with `image.convert('RGB')` first.
+        Pixel digests of cached templates outlive their images, so callers
+        can build render keys without decoding anything.
+    """
+
+    header = struct.Struct('>4sII20s')
+    magic = b'MMT2'
+    animation_magic = b'MMA2'
+
+    def __init__(self, maxsize=128, maxbytes=256 * 1024 * 1024, directory=None,
+                 disk_maxbytes=DISK_MAXBYTES):
+        self.memory = LRUCache(maxsize=maxsize, maxbytes=maxbytes,
+                               sizeof=image_nbytes)
+        self.digests = LRUCache(maxsize=maxsize * 32)
+        self.directory = directory
+        self.disk_maxbytes = disk_maxbytes
+        self.disk_hits = 0
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def disk_path(self, key):
+        digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, '%s.rgb' % digest)
+
+    def read_disk(self, key):
+        """Mapped image (or Animation) and its digest, or (None, None)."""
+        from PIL import Image
+
+        try:
+            with open(self.disk_path(key), 'rb') as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                os.utime(f.fileno())
+            magic, width, height, digest = self.header.unpack_from(mapped)
+            digest = binascii.hexlify(digest).decode('ascii')
+            if magic == self.animation_magic:
+                return Animation(mapped[self.header.size:], (width, height)), digest
+            if magic != self.magic or len(mapped) != self.header.size + width * height * 4:
+                return None, None
+            pixels = memoryview(mapped)[self.header.size:]
+            return Image.frombuffer('RGBX', (width, height), pixels, 'raw', 'RGBX', 0, 1), digest
+        except (IOError, OSError, struct.error, ValueError):
+            return None, None
+
+    def write_disk(self, key, image, digest):
+        digest = binascii.unhexlify(digest)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                if isinstance(image, Animation):
+                    f.write(self.header.pack(self.animation_magic, image.size[0],
+                                             image.size[1], digest))
+                    f.write(image.data)
+                else:
+                    f.write(self.header.pack(self.magic, image.width, image.height, digest))
+                    f.write(image.tobytes('raw', 'RGBX'))
+            os.replace(tmp_path, self.disk_path(key))
+        except (IOError, OSError):
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self.trim_disk(keep=self.disk_path(key))
+
+    def trim_disk(self, keep=None):
+        """Unlink the least recently used disk tier files past `disk_maxbytes`."""
+        if self.disk_maxbytes is None:
+            return
+        entries = []
+        try:
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith('.rgb') and entry.path != keep:
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total = sum(size for _, size, _ in entries)
+            if keep:
+                total += os.path.getsize(keep)
+        except OSError:
+            return
+        for _, size, path in sorted(entries):
+            if total <= self.disk_maxbytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def get(self, key):
+        image = self.memory.get(key)
+        if image is None and self.directory:
+            image, digest = self.read_disk(key)
+            if image is not None:
+                self.disk_hits += 1
+                self.memory.put(key, image)
+                self.digests.put(key, digest)
+        return image
+
+    def put(self, key, image, digest=None):
+        if not isinstance(image, Animation) and image.mode != 'RGB':
+            image = image.convert('RGB')
+        digest = digest or image_digest(image)
+        self.memory.put(key, image)
+        self.digests.put(key, digest)
+        if self.directory:
+            self.write_disk(key, image, digest)
+
+    def digest(self, key):
+        digest = self.digests.get(key)
+        if digest is None:
+            image = self.get(key)
+            if image is not None:
+                digest = image_digest(image)
+                self.digests.put(key, digest)
+        return digest
+
+    def stats(self):
+        stats = self.memory.stats()
+        stats['disk_hits'] = self.disk_hits
+        return stats
+
+    def clear(self):
+        self.memory.clear()
+        self.digests.clear()
+        self.disk_hits = 0
+
+
+def disk_maxbytes():
+    maxbytes = os.environ.get('MEME_MAKER_CACHE_DIR_MAXBYTES')
+    return int(maxbytes) if maxbytes else DISK_MAXBYTES
+
+
+templates = TemplateCache(directory=os.environ.get('MEME_MAKER_CACHE_DIR'),
+                          disk_maxbytes=disk_maxbytes())
@@ -0,0 +1,76 @@
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from PIL import Image
+
+from meme_maker.aio import AsyncMeme, AsyncPipeline, make_meme
+
+
+class AsyncMemeTestCase(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp() + '/'
+        os.makedirs(os.path.join(self.path, 'me/mplate'))
+        Image.new('RGB', (300, 200), 'navy').save(
+            os.path.join(self.path, 'me/mplate/test.png'))
+        self.logger = logging.getLogger('meme')
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_make_meme_stores_meme(self):
+        async def run():
+            pipeline = AsyncPipeline()
+            try:
+                return await make_meme(self.logger, 'test', None, 'top|bottom',
+                                       self.path, pipeline=pipeline)
+            finally:
+                pipeline.shutdown()
+        self.assertTrue(os.path.isfile(asyncio.run(run())))
+
+    def test_pipeline_is_reused_across_event_loops(self):
+        pipeline = AsyncPipeline(download=1, render=1, upload=1)
+
+        async def run(texts):
+            return await asyncio.gather(*(
+                make_meme(self.logger, 'test', None, text, self.path, pipeline=pipeline)
+                for text in texts))
+        try:
+            for texts in (('one', 'two'), ('three', 'four')):
+                paths = asyncio.run(run(texts))
+                self.assertTrue(all(os.path.isfile(path) for path in paths))
+        finally:
+            pipeline.shutdown()
+
+    def test_render_stage_respects_concurrency_limit(self):
+        active = []
+        peak = []
+        lock = threading.Lock()
+
+        def draw_meme():
+            with lock:
+                active.append(1)
+                peak.append(len(active))
+            time.sleep(0.02)
+            with lock:
+                active.pop()
+
+        async def run():
+            pipeline = AsyncPipeline(render=2)
+            memes = [AsyncMeme(self.logger, 'test', None, 'hi', pipeline=pipeline)
+                     for _ in range(6)]
+            for meme in memes:
+                meme.draw_meme = draw_meme
+                meme.store_meme = lambda: None
+            try:
+                await asyncio.gather(*(meme.make_meme(self.path) for meme in memes))
+            finally:
+                pipeline.shutdown()
+
+        asyncio.run(run())
+        self.assertEqual(max(peak), 2)
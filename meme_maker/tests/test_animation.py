@@ -0,0 +1,139 @@
+import io
+import logging
+import shutil
+import tempfile
+import unittest
+
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+from PIL import Image, ImageChops, ImageSequence
+
+from meme_maker.animation import Animation
+from meme_maker.formats import get_format
+from meme_maker.imaging import decode_template
+from meme_maker.meme import Meme
+from meme_maker.templates import TemplateCache
+
+
+def animated_gif(frames=6, size=(120, 90), duration=40, format='GIF'):
+    images = [Image.new('RGB', size, (40 * index % 256, 100, 200)) for index in range(frames)]
+    buffer = io.BytesIO()
+    images[0].save(buffer, format, save_all=True, append_images=images[1:],
+                   duration=duration, loop=0)
+    return buffer.getvalue()
+
+
+class StaticDownloader(object):
+    def __init__(self, content):
+        self.content = content
+
+    def get(self, url):
+        return self.content
+
+
+class AnimationTestCase(unittest.TestCase):
+    def setUp(self):
+        self.data = animated_gif()
+
+    def test_decode_template_keeps_animations(self):
+        animation = decode_template(self.data)
+        self.assertIsInstance(animation, Animation)
+        self.assertEqual(animation.n_frames, 6)
+
+        buffer = io.BytesIO()
+        Image.new('RGB', (10, 10)).save(buffer, 'GIF')
+        self.assertIsInstance(decode_template(buffer.getvalue()), Image.Image)
+
+    def test_frames_are_fitted_to_max_size(self):
+        animation = Animation(self.data, max_size=(60, 60))
+        self.assertEqual(animation.size, (60, 45))
+        self.assertTrue(all(frame.size == (60, 45) for frame, _ in animation.frames()))
+
+    def test_oversized_animation_is_reencoded_at_fitted_size(self):
+        animation = Animation(self.data, max_size=(60, 60))
+        self.assertEqual(animation.source_size, (60, 45))
+        stored = Animation(animation.data, max_size=(60, 60))
+        self.assertEqual((stored.size, stored.n_frames), ((60, 45), 6))
+        self.assertEqual(stored.data, animation.data)
+
+    def test_palette_converts_only_sampled_frames(self):
+        animation = Animation(animated_gif(frames=40, size=(20, 20)))
+        convert = Image.Image.convert
+        with patch.object(Image.Image, 'convert', autospec=True,
+                          side_effect=convert) as converted:
+            animation.palette()
+        rgb = [call for call in converted.call_args_list if call[0][1:] == ('RGB',)]
+        self.assertEqual(len(rgb), 14)
+
+    def test_webp_frames_keep_their_durations(self):
+        durations = [40, 70, 100, 40, 70]
+        data = animated_gif(frames=5, duration=durations, format='WEBP')
+        animation = Animation(data)
+        self.assertEqual([duration for _, duration in animation.frames()], durations)
+
+        buffer = io.BytesIO()
+        animation.save(buffer, get_format('webp'))
+        output = Image.open(buffer)
+        rendered = []
+        for frame in ImageSequence.Iterator(output):
+            frame.load()
+            rendered.append(frame.info['duration'])
+        self.assertEqual(rendered, durations)
+
+    def test_captioned_frames_keep_order(self):
+        animation = Animation(self.data)
+        band = Image.new('RGBA', (10, 10), (255, 255, 255, 255))
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            frames = list(animation.captioned([(band, (0, 0))], executor=executor, window=2))
+        self.assertEqual([frame.getpixel((50, 50))[0] for frame, _ in frames],
+                         [40 * index % 256 for index in range(6)])
+        self.assertTrue(all(frame.getpixel((5, 5)) == (255, 255, 255) for frame, _ in frames))
+        self.assertEqual([duration for _, duration in frames], [40] * 6)
+
+    def test_disk_tier_keeps_animations(self):
+        directory = tempfile.mkdtemp()
+        try:
+            TemplateCache(directory=directory).put('a', Animation(self.data))
+            animation = TemplateCache(directory=directory).get('a')
+            self.assertEqual(animation.data, self.data)
+        finally:
+            shutil.rmtree(directory)
+
+
+class AnimatedMemeTestCase(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp() + '/'
+        self.data = animated_gif()
+        self.source = [frame.convert('RGB') for frame in
+                       ImageSequence.Iterator(Image.open(io.BytesIO(self.data)))]
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def make_meme(self, formats):
+        meme = Meme(logging.getLogger('meme'), None, 'http://example.com/a.gif',
+                    'such|wow', downloader=StaticDownloader(self.data),
+                    template_cache=TemplateCache(), formats=formats)
+        meme.make_meme(self.path)
+        return meme
+
+    def test_every_frame_is_captioned(self):
+        for name in ('gif', 'webp'):
+            meme = self.make_meme([name])
+            output = Image.open(meme.meme_path)
+            frames = [frame.convert('RGB') for frame in ImageSequence.Iterator(output)]
+            self.assertEqual(len(frames), 6)
+            for frame, source in zip(frames, self.source):
+                self.assertIsNotNone(ImageChops.difference(frame, source).getbbox())
+
+    def test_static_formats_get_captioned_first_frame(self):
+        meme = self.make_meme(['png'])
+        output = Image.open(meme.meme_path)
+        self.assertFalse(getattr(output, 'is_animated', False))
+        self.assertEqual(output.size, (120, 90))
+
+    def test_animated_template_is_stored_in_source_format(self):
+        meme = self.make_meme(['gif'])
+        with open(meme.get_template_path('gif'), 'rb') as f:
+            self.assertEqual(f.read(), self.data)
@@ -0,0 +1,117 @@
+import io
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from unittest.mock import patch
+
+from click.testing import CliRunner
+from PIL import Image
+
+from meme_maker import batch
+from meme_maker.batch import guess_format, make_memes, read_jobs, share_templates
+from meme_maker.cli import cli
+from meme_maker.layout import LayoutCache
+from meme_maker.meme import Meme
+from meme_maker.storage import StorageError
+from meme_maker.templates import TemplateCache
+
+
+class ReadJobsTestCase(unittest.TestCase):
+    def test_reads_jsonl(self):
+        stream = io.StringIO('{"meme": "a", "text": "hi|there"}\n\n{"url": "http://x"}\n')
+        jobs = list(read_jobs(stream, 'jsonl'))
+        self.assertEqual(jobs[0], {'meme': 'a', 'url': None, 'text': 'hi|there'})
+        self.assertEqual(jobs[1]['url'], 'http://x')
+
+    def test_reads_csv(self):
+        stream = io.StringIO('meme,url,text\na,,hi\n')
+        self.assertEqual(list(read_jobs(stream, 'csv')),
+                         [{'meme': 'a', 'url': None, 'text': 'hi'}])
+
+    def test_guess_format_by_extension(self):
+        self.assertEqual(guess_format('jobs.csv'), 'csv')
+        self.assertEqual(guess_format('<stdin>'), 'jsonl')
+
+
+class MakeMemesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp() + '/'
+        os.makedirs(os.path.join(self.path, 'me/mplate'))
+        Image.new('RGB', (300, 200), 'navy').save(
+            os.path.join(self.path, 'me/mplate/test.png'))
+        self.jobs = [{'meme': 'test', 'url': None, 'text': 'top %s|bottom' % i}
+                     for i in range(3)]
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_renders_jobs_inline(self):
+        results = make_memes(self.jobs, self.path, workers=0)
+        self.assertEqual(len(results), 3)
+        self.assertTrue(all(os.path.isfile(result) for result in results))
+
+    def test_renders_jobs_in_process_pool(self):
+        results = make_memes(self.jobs, self.path, workers=2)
+        self.assertTrue(all(os.path.isfile(result) for result in results))
+
+    def test_layouts_are_collected_from_workers(self):
+        layouts = LayoutCache()
+        make_memes(self.jobs, self.path, workers=2, layouts=layouts)
+        self.assertEqual(len(layouts.snapshot()), 3)
+
+    def test_templates_are_decoded_once_for_workers(self):
+        directory = tempfile.mkdtemp()
+        try:
+            self.assertEqual(share_templates(self.jobs, self.path, directory), 1)
+            image = TemplateCache(directory=directory).get(('local:' + self.path, 'test'))
+            self.assertEqual((image.size, image.readonly), ((300, 200), 1))
+        finally:
+            shutil.rmtree(directory)
+
+    def test_templates_are_shared_concurrently(self):
+        barrier = threading.Barrier(2, timeout=5)
+        jobs = [{'meme': name, 'url': None} for name in ('a', 'b', 'a')]
+        directory = tempfile.mkdtemp()
+        try:
+            with patch.object(Meme, 'load_template', side_effect=lambda: barrier.wait()):
+                self.assertEqual(share_templates(jobs, self.path, directory), 2)
+        finally:
+            shutil.rmtree(directory)
+        self.assertFalse(barrier.broken)
+
+    def test_shared_templates_directory_is_removed(self):
+        directory = tempfile.mkdtemp()
+        with patch.object(batch, 'shared_directory', return_value=directory):
+            results = make_memes(self.jobs, self.path, workers=2)
+        self.assertTrue(all(os.path.isfile(result) for result in results))
+        self.assertFalse(os.path.exists(directory))
+
+    def test_inline_rendering_registers_no_finalizers(self):
+        with patch.object(batch, 'Finalize') as finalize:
+            make_memes(self.jobs, self.path, workers=0)
+            make_memes(self.jobs, self.path, workers=0)
+        finalize.assert_not_called()
+
+    def test_failed_job_returns_none(self):
+        self.assertEqual(make_memes([{'meme': 'missing'}], self.path, workers=0), [None])
+
+
+class CliTestCase(unittest.TestCase):
+    def test_default_command_requires_meme_and_url(self):
+        result = CliRunner().invoke(cli, ['-m', 'test'])
+        self.assertNotEqual(result.exit_code, 0)
+        self.assertIn('No parameters specified', result.output)
+
+    def test_batch_command_is_available(self):
+        result = CliRunner().invoke(cli, ['batch', '--help'])
+        self.assertEqual(result.exit_code, 0)
+
+    def test_batch_command_exits_on_storage_error(self):
+        with patch.object(batch, 'recognize_storage', side_effect=StorageError('unreachable')):
+            result = CliRunner().invoke(cli, ['batch', '--path', 'missing-bucket', '-w', '2'],
+                                        input='{"meme": "test"}\n')
+        self.assertEqual(result.exit_code, 1)
+        self.assertIsInstance(result.exception, SystemExit)
@@ -0,0 +1,57 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from click.testing import CliRunner
+
+from meme_maker.bench import (
+    STAGES,
+    Benchmark,
+    compare,
+    percentile,
+    synthetic_caption
+)
+from meme_maker.cli import cli
+
+
+class BenchHelpersTestCase(unittest.TestCase):
+    def test_percentile_uses_nearest_rank(self):
+        samples = list(range(1, 101))
+        self.assertEqual(percentile(samples, 0.5), 50)
+        self.assertEqual(percentile(samples, 0.99), 99)
+        self.assertEqual(percentile([3], 0.9), 3)
+
+    def test_synthetic_caption_has_requested_length(self):
+        self.assertEqual(len(synthetic_caption(1)), 1)
+        self.assertEqual(len(synthetic_caption(300).replace('|', '')), 300)
+
+    def test_compare_reports_only_slowdowns_above_threshold(self):
+        baseline = {'cases': {'local/small/1': {'draw': {'p50': 1.0},
+                                                 'layout': {'p50': 1.0}}}}
+        results = {'cases': {'local/small/1': {'draw': {'p50': 1.2},
+                                                'layout': {'p50': 1.5}}}}
+        self.assertEqual(compare(results, baseline, threshold=0.25),
+                         [('local/small/1', 'layout', 1.0, 1.5)])
+
+
+class BenchmarkTestCase(unittest.TestCase):
+    def test_run_reports_every_stage(self):
+        results = Benchmark(iterations=1, sizes=['small'], lengths=(20,),
+                            storages=('local',)).run()
+        self.assertEqual(set(results['cases']['local/small/20']), set(STAGES))
+        self.assertGreater(results['peak_rss_kb'], 0)
+
+    def test_cli_saves_and_compares_baseline(self):
+        directory = tempfile.mkdtemp()
+        baseline = os.path.join(directory, 'bench.json')
+        args = ['bench', '-n', '1', '-s', 'small', '--storage', 'local',
+                '--baseline', baseline]
+        try:
+            result = CliRunner().invoke(cli, args + ['--save-baseline'])
+            self.assertEqual(result.exit_code, 0, result.output)
+            self.assertTrue(os.path.isfile(baseline))
+            result = CliRunner().invoke(cli, args + ['--threshold', '1000'])
+            self.assertEqual(result.exit_code, 0, result.output)
+        finally:
+            shutil.rmtree(directory)
@@ -0,0 +1,38 @@
+import unittest
+
+from meme_maker.cache import LRUCache
+
+
+class LRUCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.cache = LRUCache(maxsize=2)
+
+    def test_get_counts_hits_and_misses(self):
+        self.cache.put('a', 1)
+        self.assertEqual(self.cache.get('a'), 1)
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual(self.cache.stats()['hits'], 1)
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        self.cache.put('a', 1)
+        self.cache.put('b', 2)
+        self.cache.get('a')
+        self.cache.put('c', 3)
+        self.assertIn('a', self.cache)
+        self.assertNotIn('b', self.cache)
+        self.assertEqual(self.cache.evictions, 1)
+
+    def test_maxbytes_bounds_summed_size(self):
+        cache = LRUCache(maxsize=10, maxbytes=5, sizeof=len)
+        cache.put('a', 'xxx')
+        cache.put('b', 'yyy')
+        self.assertNotIn('a', cache)
+        self.assertEqual(cache.currbytes, 3)
+
+    def test_get_or_create_calls_factory_once(self):
+        calls = []
+        factory = lambda: calls.append(1) or 'value'
+        self.cache.get_or_create('a', factory)
+        self.cache.get_or_create('a', factory)
+        self.assertEqual(len(calls), 1)
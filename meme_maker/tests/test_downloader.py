@@ -0,0 +1,93 @@
+import os
+import threading
+import unittest
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from meme_maker.downloader import DownloadError, Downloader
+
+
+class TemplateHandler(BaseHTTPRequestHandler):
+    etag = '"v1"'
+    body = b'x' * 1024
+    requests = []
+
+    def do_GET(self):
+        self.requests.append((self.path, self.headers.get('If-None-Match')))
+        if self.path == '/missing':
+            self.send_response(404)
+            self.end_headers()
+            return
+        if self.headers.get('If-None-Match') == self.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        if self.path != '/no-validators':
+            self.send_header('ETag', self.etag)
+        self.send_header('Content-Length', str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+
+class DownloaderTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = HTTPServer(('127.0.0.1', 0), TemplateHandler)
+        cls.url = 'http://127.0.0.1:%s' % cls.server.server_port
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        TemplateHandler.requests[:] = []
+        self.downloader = Downloader()
+
+    def tearDown(self):
+        self.downloader.close()
+
+    def test_unchanged_url_is_revalidated_with_304(self):
+        first = self.downloader.get(self.url + '/template')
+        second = self.downloader.get(self.url + '/template')
+        self.assertEqual(first, second)
+        self.assertEqual(self.downloader.revalidated, 1)
+        self.assertEqual(TemplateHandler.requests[1], ('/template', '"v1"'))
+
+    def test_response_without_validators_is_not_cached(self):
+        self.downloader.get(self.url + '/no-validators')
+        self.assertNotIn(self.url + '/no-validators', self.downloader.validators)
+
+    def test_max_bytes_guard(self):
+        downloader = Downloader(max_bytes=100)
+        with self.assertRaises(DownloadError):
+            downloader.get(self.url + '/template')
+
+    def test_http_error_raises_download_error(self):
+        with self.assertRaises(DownloadError):
+            self.downloader.get(self.url + '/missing')
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'needs fork')
+    def test_forked_child_does_not_reuse_parent_session(self):
+        self.downloader.get(self.url + '/template')
+        read_fd, write_fd = os.pipe()
+        with self.downloader._session_lock:
+            pid = os.fork()
+            if pid == 0:
+                os.close(read_fd)
+                fresh = (self.downloader._session is None and
+                         self.downloader._session_lock.acquire(blocking=False))
+                os.write(write_fd, b'1' if fresh else b'0')
+                os._exit(0)
+        os.close(write_fd)
+        result = os.read(read_fd, 1)
+        os.close(read_fd)
+        os.waitpid(pid, 0)
+        self.assertEqual(result, b'1')
+        self.assertIsNotNone(self.downloader._session)
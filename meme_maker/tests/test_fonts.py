@@ -0,0 +1,52 @@
+import unittest
+
+from meme_maker.fonts import DEFAULT_FONT_PATH, FontRegistry
+
+
+class FontRegistryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.registry = FontRegistry(maxsize=2)
+
+    def test_same_path_and_size_returns_cached_font(self):
+        font = self.registry.get(DEFAULT_FONT_PATH, 20)
+        self.assertIs(self.registry.get(DEFAULT_FONT_PATH, 20), font)
+        self.assertEqual(self.registry.stats()['hits'], 1)
+        self.assertEqual(self.registry.stats()['misses'], 1)
+
+    def test_fonts_are_keyed_by_size(self):
+        small = self.registry.get(DEFAULT_FONT_PATH, 12)
+        big = self.registry.get(DEFAULT_FONT_PATH, 40)
+        self.assertNotEqual(small.size, big.size)
+
+    def test_registry_is_bounded(self):
+        for size in (10, 11, 12):
+            self.registry.get(DEFAULT_FONT_PATH, size)
+        self.assertEqual(self.registry.stats()['size'], 2)
+
+
+class FontMetricsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.metrics = FontRegistry().metrics(DEFAULT_FONT_PATH)
+
+    def test_text_width_scales_linearly_with_size(self):
+        self.assertAlmostEqual(self.metrics.text_width('MEME', 40),
+                               2 * self.metrics.text_width('MEME', 20))
+
+    def test_fit_size_picks_largest_size_within_max_ratio(self):
+        text, width = 'ONE DOES NOT SIMPLY', 500
+        size = self.metrics.fit_size(text, width)
+        self.assertLessEqual(self.metrics.measure(text, size), 0.9 * width)
+        self.assertGreater(self.metrics.measure(text, size + 1), 0.9 * width)
+        self.assertGreaterEqual(self.metrics.measure(text, size), 0.7 * width)
+
+    def test_fit_size_is_clamped(self):
+        self.assertEqual(self.metrics.fit_size('A', 5000), 70)
+        self.assertEqual(self.metrics.fit_size('A' * 200, 100), 12)
+        self.assertEqual(self.metrics.fit_size('', 100), 70)
+
+    def test_fit_size_needs_few_measurements(self):
+        calls = []
+        measure = self.metrics.measure
+        self.metrics.measure = lambda text, size: calls.append(size) or measure(text, size)
+        self.metrics.fit_size('BRACE YOURSELVES WINTER IS COMING', 800)
+        self.assertLessEqual(len(calls), 6)
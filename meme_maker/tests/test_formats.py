@@ -0,0 +1,53 @@
+import io
+import logging
+import unittest
+
+from PIL import Image
+
+from meme_maker.formats import get_format, get_formats
+from meme_maker.meme import Meme
+from meme_maker.storage import MemoryStorage
+from meme_maker.templates import TemplateCache
+
+
+class OutputFormatTestCase(unittest.TestCase):
+    def test_aliases_and_case_are_normalized(self):
+        self.assertEqual(get_format('JPG').name, 'jpeg')
+
+    def test_unknown_format_raises_value_error(self):
+        with self.assertRaises(ValueError):
+            get_format('bmp')
+
+    def test_only_supported_options_are_applied(self):
+        png, webp = get_formats(['png', 'webp'], quality=50, compress_level=9)
+        self.assertNotIn('quality', png.options)
+        self.assertEqual(png.options['compress_level'], 9)
+        self.assertEqual(webp.options['quality'], 50)
+
+    def test_none_options_keep_defaults(self):
+        self.assertEqual(get_format('jpeg', quality=None).options['quality'], 85)
+
+    def test_save_encodes_in_format(self):
+        buffer = io.BytesIO()
+        get_format('webp', lossless=True).save(Image.new('RGB', (8, 8)), buffer)
+        buffer.seek(0)
+        self.assertEqual(Image.open(buffer).format, 'WEBP')
+
+
+class MemeFormatsTestCase(unittest.TestCase):
+    def test_one_render_is_stored_in_every_format(self):
+        storage = MemoryStorage()
+        meme = Meme(logging.getLogger('meme'), 'test', None, 'hi',
+                    storage=storage, formats=['png', 'jpeg', 'webp'],
+                    template_cache=TemplateCache())
+        meme.template_cache.put(meme.template_key(), Image.new('RGB', (100, 80)))
+        path = meme.make_meme('')
+
+        self.assertTrue(path.endswith('.png'))
+        content_types = dict(
+            (key.rsplit('.', 1)[1], value['content_type'])
+            for key, value in storage.objects.items() if key.startswith('me/me/')
+        )
+        self.assertEqual(content_types, {'png': 'image/png',
+                                         'jpg': 'image/jpeg',
+                                         'webp': 'image/webp'})
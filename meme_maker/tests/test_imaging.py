@@ -0,0 +1,60 @@
+import io
+import logging
+import unittest
+import unittest.mock
+
+from unittest.mock import patch
+
+from PIL import Image, JpegImagePlugin
+
+from meme_maker.imaging import decode_image
+from meme_maker.meme import Meme
+from meme_maker.storage import MemoryStorage
+from meme_maker.templates import TemplateCache
+
+
+def encode(image, format):
+    buffer = io.BytesIO()
+    image.save(buffer, format=format)
+    return buffer.getvalue()
+
+
+class DecodeImageTestCase(unittest.TestCase):
+    def test_large_jpeg_is_decoded_within_max_size(self):
+        data = encode(Image.new('RGB', (4000, 3000), 'red'), 'JPEG')
+        jpeg = JpegImagePlugin.JpegImageFile
+        with patch.object(jpeg, 'draft', autospec=True,
+                          side_effect=jpeg.draft) as draft:
+            image = decode_image(data, (1000, 1000))
+        draft.assert_called_once()
+        self.assertEqual(image.size, (1000, 750))
+        self.assertEqual(image.mode, 'RGB')
+
+    def test_large_palette_png_is_downscaled(self):
+        data = encode(Image.new('P', (3000, 1000)), 'PNG')
+        image = decode_image(data, (600, 600))
+        self.assertEqual(image.size, (600, 200))
+        self.assertEqual(image.mode, 'RGB')
+
+    def test_small_image_keeps_resolution(self):
+        data = encode(Image.new('RGBA', (300, 200)), 'PNG')
+        image = decode_image(data, (600, 600))
+        self.assertEqual((image.size, image.mode), ((300, 200), 'RGB'))
+
+    def test_no_max_size_keeps_resolution(self):
+        data = encode(Image.new('RGB', (3000, 10)), 'PNG')
+        self.assertEqual(decode_image(data).size, (3000, 10))
+
+
+class MemeIngestTestCase(unittest.TestCase):
+    def test_downloaded_template_is_stored_downscaled(self):
+        storage = MemoryStorage()
+        meme = Meme(logging.getLogger('meme'), None, 'http://example.com/big.jpg', 'hi',
+                    storage=storage, template_cache=TemplateCache(),
+                    max_template_size=(500, 500))
+        meme.downloader = unittest.mock.Mock()
+        meme.downloader.get.return_value = encode(Image.new('RGB', (2000, 1000)), 'JPEG')
+        meme.make_meme('')
+
+        stored = Image.open(io.BytesIO(storage.read(meme.template_path)))
+        self.assertEqual(stored.size, (500, 250))
@@ -0,0 +1,86 @@
+import io
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+from unittest.mock import patch
+
+from PIL import Image
+
+from meme_maker import meme as meme_module
+from meme_maker.importer import import_templates, read_templates
+from meme_maker.index import INDEX_PATH, TemplateIndex, indexes
+from meme_maker.meme import Meme
+from meme_maker.storage import LocalStorage
+from meme_maker.templates import TemplateCache
+
+
+def png(size):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, 'red').save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class StubDownloader(object):
+    def __init__(self, contents):
+        self.contents = contents
+        self.urls = []
+
+    def get(self, url):
+        self.urls.append(url)
+        return self.contents[url]
+
+
+class TemplateImportTestCase(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp() + '/'
+        self.downloader = StubDownloader({
+            'http://example.com/doge.png': png((4000, 1000)),
+            'http://example.com/cat.png': png((300, 200)),
+            'http://example.com/broken.png': b'not an image',
+        })
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+        indexes.clear()
+
+    def import_templates(self, templates):
+        with patch.object(meme_module, 'default_downloader', self.downloader):
+            return import_templates(templates, self.path, workers=2)
+
+    def test_read_templates_from_csv(self):
+        stream = io.StringIO('name,url\ndoge,http://example.com/doge.png\n')
+        self.assertEqual(list(read_templates(stream, 'csv')),
+                         [('doge', 'http://example.com/doge.png')])
+
+    def test_templates_are_stored_downscaled_and_indexed(self):
+        index, failed = self.import_templates([
+            ('doge', 'http://example.com/doge.png'),
+            ('cat', 'http://example.com/cat.png'),
+            ('broken', 'http://example.com/broken.png'),
+        ])
+        self.assertEqual(failed, ['broken'])
+        entry = index.get('doge')
+        self.assertEqual((entry.width, entry.height, entry.format), (2048, 512, 'png'))
+        stored = os.path.join(self.path, 'me/mplate/doge.png')
+        self.assertEqual(entry.bytes, os.path.getsize(stored))
+
+        stored_index = TemplateIndex.load(LocalStorage(self.path))
+        self.assertEqual(stored_index.get('cat'), index.get('cat'))
+        self.assertTrue(os.path.isfile(os.path.join(self.path, INDEX_PATH)))
+
+    def test_import_merges_into_existing_index(self):
+        self.import_templates([('doge', 'http://example.com/doge.png')])
+        index, _ = self.import_templates([('cat', 'http://example.com/cat.png')])
+        self.assertEqual(sorted(index.entries), ['cat', 'doge'])
+
+    def test_indexed_template_is_rendered_without_probing(self):
+        self.import_templates([('doge', 'http://example.com/doge.png')])
+        meme = Meme(logging.getLogger('meme'), 'doge', None, 'wow',
+                    template_cache=TemplateCache())
+        with patch.object(Meme, 'get_image', wraps=meme.get_image) as get_image:
+            path = meme.make_meme(self.path)
+        self.assertTrue(os.path.isfile(path))
+        get_image.assert_called_once_with(os.path.join(self.path, 'me/mplate/doge.png'))
@@ -0,0 +1,47 @@
+import os
+import subprocess
+import sys
+import unittest
+
+
+HEAVY_MODULES = ('boto3', 'botocore', 'requests', 'PIL', 'yaml')
+
+# Cumulative `-X importtime` budget for `import meme_maker.cli`, in ms.
+IMPORT_BUDGET_MS = float(os.environ.get('MEME_MAKER_IMPORT_BUDGET_MS', 250))
+
+
+def run_python(*args):
+    return subprocess.run(
+        [sys.executable] + list(args),
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        universal_newlines=True, check=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+
+def import_times(module):
+    """Cumulative import time in microseconds per imported module."""
+    output = run_python('-X', 'importtime', '-c', 'import %s' % module).stderr
+    times = {}
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+class ImportTimeTestCase(unittest.TestCase):
+
+    def test_cli_import_does_not_load_heavy_dependencies(self):
+        loaded = run_python('-c', (
+            'import sys, meme_maker.cli; '
+            'print(" ".join(sorted(set(m.split(".")[0] for m in sys.modules))))'
+        )).stdout.split()
+        for module in HEAVY_MODULES:
+            self.assertNotIn(module, loaded)
+
+    def test_cli_import_time_budget(self):
+        # Best of three, to keep a busy machine from failing the build.
+        cumulative = min(import_times('meme_maker.cli')['meme_maker.cli']
+                         for _ in range(3))
+        self.assertLess(cumulative / 1000.0, IMPORT_BUDGET_MS)
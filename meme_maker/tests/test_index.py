@@ -0,0 +1,137 @@
+import io
+import json
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+from unittest.mock import patch
+
+from PIL import Image
+
+from meme_maker.index import INDEX_PATH, TemplateEntry, TemplateIndex, TemplateIndexes
+from meme_maker.meme import Meme
+from meme_maker.storage import LocalStorage, MemoryStorage
+from meme_maker.templates import TemplateCache
+
+
+class StubDownloader(object):
+    def __init__(self, content):
+        self.content = content
+
+    def get(self, url):
+        return self.content
+
+
+def png_bytes(size=(200, 100)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, 'blue').save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class TemplateIndexTestCase(unittest.TestCase):
+    def setUp(self):
+        self.storage = MemoryStorage('bucket/')
+
+    def test_refresh_lists_templates_and_marks_index_complete(self):
+        for path in ('a.png', 'a.gif', 'b.webp', 'index.json', 'c.txt'):
+            self.storage.write('bucket/me/mplate/' + path, b'data', 'image/png')
+        index = TemplateIndex()
+        self.assertTrue(index.refresh(self.storage))
+        self.assertTrue(index.complete)
+        self.assertEqual(sorted(index.entries), ['a', 'b'])
+        self.assertEqual(index.get('a'), TemplateEntry(None, None, None, 'png', 4))
+
+    def test_refresh_keeps_known_entries_of_unchanged_objects(self):
+        self.storage.write('bucket/me/mplate/a.png', b'data', 'image/png')
+        entry = TemplateEntry('digest', 2, 2, 'png', 4)
+        index = TemplateIndex({'a': entry, 'gone': entry}, complete=True)
+        self.assertTrue(index.refresh(self.storage))
+        self.assertEqual(index.entries, {'a': entry})
+        self.assertFalse(index.refresh(self.storage))
+
+    def test_record_merges_with_stored_index(self):
+        entry = TemplateEntry('digest', 2, 2, 'png', 4)
+        TemplateIndex({'other': entry}).save(self.storage)
+        index = TemplateIndex()
+        index.record(self.storage, 'mine', entry)
+        self.assertEqual(sorted(TemplateIndex.load(self.storage).entries), ['mine', 'other'])
+
+    def test_refresh_keeps_templates_recorded_while_listing(self):
+        self.storage.write('bucket/me/mplate/a.png', b'data', 'image/png')
+        index = TemplateIndex()
+        entry = TemplateEntry('digest', 2, 2, 'png', 4)
+        listing = self.storage.list
+
+        def list_and_record(prefix):
+            for item in listing(prefix):
+                yield item
+            index.record(self.storage, 'late', entry)
+
+        with patch.object(self.storage, 'list', side_effect=list_and_record):
+            index.refresh(self.storage)
+        self.assertEqual(sorted(index.entries), ['a', 'late'])
+
+    def test_completeness_is_not_persisted(self):
+        TemplateIndex({}, complete=True).save(self.storage)
+        self.assertFalse(TemplateIndex.load(self.storage).complete)
+
+    def test_indexes_refresh_periodically(self):
+        indexes = TemplateIndexes(refresh_interval=0)
+        index = indexes.get(self.storage)
+        self.storage.write('bucket/me/mplate/new.png', b'data', 'image/png')
+        self.assertIs(indexes.get(self.storage), index)
+        self.assertIn('new', index)
+
+
+class IndexedMemeTestCase(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp() + '/'
+        self.storage = LocalStorage(self.path)
+        self.indexes = TemplateIndexes()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def make_meme(self, name, url=None):
+        return Meme(logging.getLogger('meme'), name, url, 'wow',
+                    template_cache=TemplateCache(), template_indexes=self.indexes,
+                    downloader=StubDownloader(png_bytes()))
+
+    def test_stored_template_is_recorded_in_index(self):
+        self.make_meme('doge', 'http://example.com/doge.png').make_meme(self.path)
+        with open(os.path.join(self.path, INDEX_PATH)) as f:
+            stored = json.load(f)
+        digest, width, height, format, size = stored['templates']['doge']
+        self.assertEqual((width, height, format), (200, 100, 'png'))
+        self.assertEqual(size, os.path.getsize(self.path + 'me/mplate/doge.png'))
+        self.assertNotIn('complete', stored)
+
+    def test_complete_index_skips_storage_probes(self):
+        meme = self.make_meme('doge', 'http://example.com/doge.png')
+        with patch.object(Meme, 'get_image') as get_image:
+            self.assertTrue(os.path.isfile(meme.make_meme(self.path)))
+        get_image.assert_not_called()
+
+    def test_listed_template_is_read_from_its_path(self):
+        Image.new('RGB', (200, 100)).save(self.path + 'me/mplate/cat.gif')
+        meme = self.make_meme('cat')
+        with patch.object(Meme, 'get_image', wraps=meme.get_image) as get_image:
+            self.assertTrue(os.path.isfile(meme.make_meme(self.path)))
+        get_image.assert_called_once_with(self.path + 'me/mplate/cat.gif')
+
+    def test_template_stored_by_another_process_is_found(self):
+        warm = self.make_meme('doge', 'http://example.com/doge.png')
+        self.assertTrue(os.path.isfile(warm.make_meme(self.path)))
+        self.assertTrue(self.indexes.get(self.storage).complete)
+
+        other = Meme(logging.getLogger('meme'), 'cat', 'http://example.com/cat.png', 'wow',
+                     template_cache=TemplateCache(), template_indexes=TemplateIndexes(),
+                     downloader=StubDownloader(png_bytes()))
+        other.make_meme(self.path)
+
+        meme = self.make_meme('cat')
+        path = meme.make_meme(self.path)
+        self.assertIsNotNone(path)
+        self.assertTrue(os.path.isfile(path))
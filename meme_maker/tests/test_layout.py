@@ -0,0 +1,62 @@
+import io
+import logging
+import unittest
+
+from unittest.mock import patch
+
+from PIL import Image
+
+from meme_maker.layout import CaptionLayout, LayoutCache, TextLayout
+from meme_maker.meme import Meme
+
+
+class TextLayoutTestCase(unittest.TestCase):
+    def setUp(self):
+        self.layout = TextLayout([
+            CaptionLayout(lines=('ONE DOES', 'NOT'), font_size=40,
+                          width=300.0, height=90, x=50.0, y=10.0)
+        ])
+
+    def test_dict_roundtrip(self):
+        self.assertEqual(TextLayout.from_dict(self.layout.to_dict()), self.layout)
+
+    def test_cache_dump_and_load(self):
+        cache = LayoutCache()
+        cache.put(('ONE', (400, 300), 'impact.ttf', 0.04), self.layout)
+        stream = io.StringIO()
+        cache.dump(stream)
+        stream.seek(0)
+
+        loaded = LayoutCache()
+        loaded.load(stream)
+        self.assertEqual(loaded.get(('ONE', (400, 300), 'impact.ttf', 0.04)), self.layout)
+
+
+class MemeLayoutTestCase(unittest.TestCase):
+    def make_meme(self, text, size=(400, 300)):
+        meme = Meme(logging.getLogger('meme'), 'test', None, text,
+                    layout_cache=self.cache)
+        meme.image = Image.new('RGB', size)
+        return meme
+
+    def setUp(self):
+        self.cache = LayoutCache()
+
+    def test_layout_has_top_and_bottom_captions(self):
+        layout = self.make_meme('one does not|simply').get_layout()
+        top, bottom = layout.captions
+        self.assertEqual(top.lines, ('ONE DOES NOT',))
+        self.assertLess(top.y, bottom.y)
+        self.assertLessEqual(bottom.y + bottom.height, 300)
+
+    def test_layout_is_reused_for_same_text_and_size(self):
+        self.make_meme('one does not|simply').draw_meme()
+        with patch.object(Meme, 'prepare_text') as prepare_text:
+            self.make_meme('ONE  does not|simply ').draw_meme()
+        prepare_text.assert_not_called()
+        self.assertEqual(self.cache.stats()['hits'], 1)
+
+    def test_layout_depends_on_image_size(self):
+        self.make_meme('hello').get_layout()
+        self.make_meme('hello', size=(800, 600)).get_layout()
+        self.assertEqual(self.cache.stats()['size'], 2)
@@ -1,6 +1,123 @@
+import io
+import logging
+import tempfile
 import unittest
+
+from unittest.mock import patch
+
+from PIL import Image, ImageDraw
+
+from meme_maker.formats import get_format
 from meme_maker.meme import Meme
+from meme_maker.storage import MemoryStorage
+from meme_maker.templates import TemplateCache
+
 
 class MemeBasicTestCase(unittest.TestCase):
     def test_dummy(self):
-        self.assertEqual(True, True)
\ No newline at end of file
+        self.assertEqual(True, True)
+
+
+class MemeDrawTestCase(unittest.TestCase):
+    def setUp(self):
+        self.meme = Meme(logging.getLogger('meme'), 'test', None, 'top|bottom')
+        self.meme.image = Image.new('RGB', (400, 300), 'gray')
+
+    def test_draw_meme_changes_image(self):
+        self.meme.draw_meme()
+        self.assertNotEqual(self.meme.image.getextrema(), ((128, 128),) * 3)
+
+    def test_template_is_not_drawn_on(self):
+        template = self.meme.image
+        self.meme.draw_meme()
+        self.assertIsNot(self.meme.image, template)
+        self.assertEqual(template.getextrema(), ((128, 128),) * 3)
+
+    def test_captions_are_drawn_on_bands(self):
+        self.meme.draw_meme()
+        self.assertEqual(len(self.meme.captions), 2)
+        for band, (x, y) in self.meme.captions:
+            self.assertEqual(band.mode, 'RGBA')
+            self.assertLess(band.height, self.meme.image.height / 2)
+
+    def test_optimize_font_keeps_longest_line_within_image(self):
+        self.meme.draw_meme()
+        font, width = self.meme.optimize_font(['ONE DOES NOT', 'SIMPLY'])
+        self.assertLessEqual(width, 0.9 * self.meme.image.width)
+
+
+class MemeStoreImageTestCase(unittest.TestCase):
+    def setUp(self):
+        self.storage = MemoryStorage()
+        self.meme = Meme(logging.getLogger('meme'), 'test', None, 'hi',
+                         storage=self.storage)
+        self.meme.image = Image.new('RGB', (40, 30), 'red')
+
+    def test_image_is_encoded_once_without_temp_files(self):
+        with patch.object(tempfile, 'NamedTemporaryFile') as named_temporary_file, \
+                patch.object(Image.Image, 'save', autospec=True,
+                             side_effect=Image.Image.save) as save:
+            self.meme.store_image('me/me/a.png')
+        named_temporary_file.assert_not_called()
+        self.assertEqual(save.call_count, 1)
+        stored = self.storage.objects['me/me/a.png']
+        self.assertEqual(stored['content_type'], 'image/png')
+        self.assertEqual(Image.open(io.BytesIO(stored['data'])).size, (40, 30))
+
+    def test_encode_buffer_is_reused(self):
+        self.meme.store_image('me/me/a.png')
+        self.meme.store_image('me/me/b.png')
+        self.assertEqual(self.storage.objects['me/me/a.png'],
+                         self.storage.objects['me/me/b.png'])
+
+
+class MemeRenderCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.storage = MemoryStorage()
+        self.templates = TemplateCache()
+        self.templates.put(('memory:', 'test'), Image.new('RGB', (200, 100)))
+
+    def make_meme(self, text, **kwargs):
+        meme = Meme(logging.getLogger('meme'), 'test', None, text,
+                    storage=self.storage, template_cache=self.templates, **kwargs)
+        return meme, meme.make_meme('')
+
+    def test_identical_request_reuses_stored_meme(self):
+        first, path = self.make_meme('one does not|simply')
+        with patch.object(Meme, 'draw_meme') as draw_meme, \
+                patch.object(Meme, 'load_template') as load_template:
+            second, same_path = self.make_meme('  ONE does  NOT|simply ')
+        self.assertEqual(path, same_path)
+        draw_meme.assert_not_called()
+        load_template.assert_not_called()
+
+    def test_output_key_depends_on_text_and_format_options(self):
+        paths = set([
+            self.make_meme('top')[1],
+            self.make_meme('bottom')[1],
+            self.make_meme('top', formats=[get_format('png', compress_level=1)])[1],
+        ])
+        self.assertEqual(len(paths), 3)
+
+    def test_output_key_depends_on_template_pixels(self):
+        meme, path = self.make_meme('top')
+        self.templates.put(('memory:', 'test'), Image.new('RGB', (200, 100), 'red'))
+        self.assertNotEqual(self.make_meme('top')[1], path)
+
+
+class MemeOutlineTestCase(unittest.TestCase):
+    def setUp(self):
+        self.meme = Meme(logging.getLogger('meme'), 'test', None, 'hi')
+
+    def test_outline_scales_with_font_size(self):
+        small = self.meme.outline_width(self.meme.get_font(12))
+        big = self.meme.outline_width(self.meme.get_font(70))
+        self.assertEqual(small, 1)
+        self.assertGreater(big, small)
+
+    def test_caption_is_drawn_in_single_pass(self):
+        self.meme.image = Image.new('RGB', (400, 300), 'gray')
+        with patch.object(ImageDraw.ImageDraw, 'multiline_text', autospec=True) as draw:
+            self.meme.draw_meme()
+        self.assertEqual(draw.call_count, 1)
+        self.assertEqual(draw.call_args[1]['stroke_fill'], 'black')
@@ -0,0 +1,91 @@
+import logging
+import socket
+import unittest
+
+from PIL import Image
+
+from meme_maker.meme import Meme
+from meme_maker.metrics import LoggingSink, MemorySink, Metrics, StatsdSink
+from meme_maker.plugins import PluginContext
+from meme_maker.storage import MemoryStorage
+from meme_maker.templates import TemplateCache
+
+try:
+    import prometheus_client
+except ImportError:
+    prometheus_client = None
+
+
+class MetricsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.sink = MemorySink()
+        self.metrics = Metrics([self.sink])
+
+    def test_span_records_timing(self):
+        with self.metrics.span('draw'):
+            pass
+        self.assertEqual(self.sink.snapshot()['timings']['draw']['count'], 1)
+
+    def test_span_records_timing_when_stage_fails(self):
+        with self.assertRaises(ValueError):
+            with self.metrics.span('draw'):
+                raise ValueError()
+        self.assertIn('draw', self.sink.snapshot()['timings'])
+
+    def test_incr_sums_counters(self):
+        self.metrics.incr('bytes.uploaded', 10)
+        self.metrics.incr('bytes.uploaded', 5)
+        self.assertEqual(self.sink.snapshot()['counters']['bytes.uploaded'], 15)
+
+    def test_logging_sink(self):
+        with self.assertLogs('meme.metrics', level='INFO') as logs:
+            Metrics([LoggingSink()]).incr('cache.layout.hit')
+        self.assertIn('cache.layout.hit', logs.output[0])
+
+    def test_statsd_sink_sends_udp_packets(self):
+        server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        server.bind(('127.0.0.1', 0))
+        server.settimeout(1)
+        try:
+            sink = StatsdSink('127.0.0.1', server.getsockname()[1])
+            sink.incr('cache.render.hit', 1)
+            self.assertEqual(server.recv(1024), b'meme.cache.render.hit:1|c')
+            sink.timing('draw', 0.0015)
+            self.assertEqual(server.recv(1024), b'meme.draw:1.500|ms')
+        finally:
+            server.close()
+
+    @unittest.skipIf(prometheus_client is None, 'prometheus_client is not installed')
+    def test_prometheus_sink(self):
+        from meme_maker.metrics import PrometheusSink
+        registry = prometheus_client.CollectorRegistry()
+        sink = PrometheusSink(registry=registry)
+        sink.incr('bytes.uploaded', 3)
+        self.assertEqual(registry.get_sample_value('meme_bytes_uploaded_total'), 3)
+
+
+class MemeMetricsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.sink = MemorySink()
+        self.meme = Meme(logging.getLogger('meme'), 'test', None, 'top|bottom',
+                         storage=MemoryStorage(), template_cache=TemplateCache(),
+                         metrics=Metrics([self.sink]))
+
+    def test_make_meme_reports_stages_bytes_and_caches(self):
+        self.meme.set_paths()
+        self.meme.image = Image.new('RGB', (200, 100))
+        self.meme.store_image(self.meme.template_path)
+        self.meme.image = None
+        self.meme.make_meme('')
+
+        snapshot = self.sink.snapshot()
+        for stage in ('read', 'decode', 'layout', 'draw', 'encode', 'upload', 'make_meme'):
+            self.assertIn(stage, snapshot['timings'])
+        self.assertGreater(snapshot['counters']['bytes.uploaded'], 0)
+        self.assertGreater(snapshot['counters']['bytes.read'], 0)
+        self.assertEqual(snapshot['counters']['cache.template.miss'], 1)
+        self.assertEqual(snapshot['counters']['cache.render.miss'], 1)
+
+    def test_plugin_context_exposes_metrics(self):
+        context = PluginContext(self.meme, None, (), {})
+        self.assertIs(context.metrics, self.meme.metrics)
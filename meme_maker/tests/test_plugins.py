@@ -2,12 +2,21 @@ import unittest
 from unittest.mock import MagicMock, patch, mock_open
 
 import os
+import shutil
+import tempfile
+import threading
 
+from meme_maker.metrics import Metrics
 from meme_maker.plugins import (
+    ALL_EVENTS,
+    BACKGROUND,
     Plugin,
+    PluginExecutor,
     PluginMeta,
     PluginsLoader,
-    PluginValidator
+    PluginValidator,
+    default_manifest_path,
+    subscribe
 )
 
 fake_meta = {
@@ -104,5 +113,213 @@ class PluginMetaTestCase(unittest.TestCase):
 
 class PluginLoaderTestCase(unittest.TestCase):
     #TODO: Write more :-) PluginLoader tests
-    pass
+    def make_plugin(self, name, handler, events=None):
+        plugin = Plugin()
+        plugin.meta = dict(fake_meta, name=name)
+        if events is not None:
+            plugin.meta['events'] = events
+        plugin.module = MagicMock(run=handler)
+        return plugin
 
+    def setUp(self):
+        self.loader = PluginsLoader()
+        self.calls = []
+
+        @self.loader.dispatch
+        def get_image(meme):
+            return 'image'
+        self.get_image = get_image
+
+    def record(self, context):
+        self.calls.append(context.event)
+
+    def add(self, plugin):
+        self.loader.plugins[plugin.name] = plugin
+        self.loader.compile_routes()
+
+    def test_plugin_without_events_subscribes_to_all(self):
+        self.assertEqual(self.make_plugin('fake', self.record).events, [ALL_EVENTS])
+
+    def test_subscribe_decorator_declares_events(self):
+        handler = subscribe(['post_get_image'])(lambda context: None)
+        self.assertEqual(self.make_plugin('fake', handler).events, ['post_get_image'])
+
+    def test_routes_are_compiled_from_meta_events(self):
+        self.add(self.make_plugin('fake', self.record, events=['pre_get_image']))
+        self.assertEqual(self.loader.routes, {'pre_get_image': ['fake']})
+
+    def test_dispatch_calls_only_subscribed_handlers(self):
+        self.add(self.make_plugin('fake', self.record, events=['post_get_image']))
+        self.assertEqual(self.get_image(None), 'image')
+        self.assertEqual(self.calls, ['post_get_image'])
+
+    def test_dispatch_without_subscribers_skips_context(self):
+        self.add(self.make_plugin('fake', self.record, events=['post_other']))
+        with patch('meme_maker.plugins.PluginContext') as context:
+            self.assertEqual(self.get_image(None), 'image')
+        context.assert_not_called()
+
+    def test_wildcard_plugins_receive_every_event(self):
+        self.add(self.make_plugin('fake', self.record))
+        self.get_image(None)
+        self.assertEqual(self.calls, ['pre_get_image', 'post_get_image'])
+
+    def test_dispatch_keeps_handler_name(self):
+        self.assertEqual(self.get_image.__name__, 'get_image')
+
+
+
+class LazyPluginsLoaderTestCase(unittest.TestCase):
+    plugin_yaml = (
+        'name: lazy\n'
+        'version: 0\n'
+        'scm: http://fake.git.repo\n'
+        'script: lazy.py\n'
+        'handler: run\n'
+        'events:\n'
+        '  - post_get_image\n'
+    )
+
+    def setUp(self):
+        self.plugins_path = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.plugins_path, 'lazy'))
+        for name, content in (('plugin.yaml', self.plugin_yaml), ('lazy.py', '')):
+            with open(os.path.join(self.plugins_path, 'lazy', name), 'w') as f:
+                f.write(content)
+        self.manifest_path = os.path.join(self.plugins_path, 'manifest.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.plugins_path)
+
+    def make_loader(self):
+        loader = PluginsLoader(self.plugins_path, self.manifest_path)
+        loader.discover()
+        return loader
+
+    def test_discover_defers_loading_until_first_dispatch(self):
+        loader = self.make_loader()
+        self.assertEqual(loader.plugins, {})
+        self.assertEqual(loader.subscribers('post_get_image'), ['lazy'])
+        self.assertTrue(os.path.exists(self.manifest_path))
+
+    def test_plugin_module_is_not_imported_before_its_event(self):
+        loader = self.make_loader()
+        loader.subscribers('post_get_image')
+        plugin = loader.plugins['lazy']
+        self.assertIsNone(plugin.module)
+        self.assertEqual(plugin.module_name, 'meme_maker.plugins.lazy.lazy')
+        with patch('importlib.import_module') as import_module:
+            plugin.handler
+        import_module.assert_called_once_with('meme_maker.plugins.lazy.lazy')
+
+    def test_manifest_is_reused_while_plugins_are_unchanged(self):
+        self.make_loader().subscribers('post_get_image')
+        with patch.object(PluginMeta, 'get_meta_content') as get_meta_content:
+            loader = self.make_loader()
+            loader.subscribers('post_get_image')
+        get_meta_content.assert_not_called()
+        self.assertEqual(loader.plugins['lazy'].events, ['post_get_image'])
+
+    def test_manifest_is_rebuilt_when_plugins_change(self):
+        self.make_loader().subscribers('post_get_image')
+        meta_path = os.path.join(self.plugins_path, 'lazy', 'plugin.yaml')
+        with open(meta_path, 'w') as f:
+            f.write(self.plugin_yaml.replace('post_get_image', 'pre_get_image'))
+        mtime = os.path.getmtime(meta_path) + 10
+        os.utime(meta_path, (mtime, mtime))
+        loader = self.make_loader()
+        self.assertEqual(loader.subscribers('pre_get_image'), ['lazy'])
+
+    def test_default_manifest_goes_to_user_cache_directory(self):
+        cache_home = os.path.join(self.plugins_path, 'cache')
+        with patch.dict(os.environ, {'XDG_CACHE_HOME': cache_home}):
+            path = default_manifest_path(self.plugins_path)
+        self.assertTrue(path.startswith(os.path.join(cache_home, 'meme-maker') + os.sep))
+
+    def test_default_manifest_falls_back_to_temporary_directory(self):
+        with patch.dict(os.environ, {'XDG_CACHE_HOME': '/proc/read-only'}):
+            path = default_manifest_path(self.plugins_path)
+        self.assertEqual(os.path.dirname(path), tempfile.gettempdir())
+
+
+class PluginExecutionTestCase(unittest.TestCase):
+    def setUp(self):
+        self.executor = PluginExecutor(workers=1, queue_size=1, metrics=Metrics())
+        self.blocking = PluginExecutor(workers=1, queue_size=4, metrics=Metrics())
+        self.loader = PluginsLoader(executor=self.executor, blocking_executor=self.blocking)
+        self.release = threading.Event()
+        self.calls = []
+
+        @self.loader.dispatch
+        def get_image(meme):
+            return 'image'
+        self.get_image = get_image
+
+    def tearDown(self):
+        self.release.set()
+        self.executor.shutdown(timeout=5)
+        self.blocking.shutdown(timeout=5)
+
+    def add(self, handler, **meta):
+        plugin = Plugin()
+        plugin.meta = dict(fake_meta, events=['post_get_image'], **meta)
+        plugin.module = MagicMock(run=handler)
+        self.loader.plugins[plugin.name] = plugin
+        self.loader.compile_routes()
+
+    def slow(self, context):
+        self.release.wait(5)
+        self.calls.append(context.event)
+
+    def test_background_plugin_does_not_block_dispatch(self):
+        self.add(self.slow, mode=BACKGROUND)
+        self.assertEqual(self.get_image(None), 'image')
+        self.assertEqual(self.calls, [])
+        self.release.set()
+        self.assertTrue(self.loader.flush())
+        self.assertEqual(self.calls, ['post_get_image'])
+        self.assertEqual(self.executor.stats()['completed'], 1)
+
+    def test_background_calls_above_queue_size_are_dropped(self):
+        self.add(self.slow, mode=BACKGROUND)
+        self.get_image(None)
+        self.get_image(None)
+        self.assertEqual(self.executor.stats()['dropped'], 1)
+
+    def test_blocking_plugin_timeout_stops_waiting(self):
+        self.add(self.slow, timeout=0.05)
+        self.assertEqual(self.get_image(None), 'image')
+        self.assertEqual(self.calls, [])
+        self.assertEqual(self.blocking.stats()['timeouts'], 1)
+
+    def test_blocking_plugin_does_not_queue_behind_background_plugins(self):
+        self.add(self.slow, mode=BACKGROUND)
+        quick = []
+        plugin = Plugin()
+        plugin.meta = dict(fake_meta, name='quick', events=['post_get_image'], timeout=0.5)
+        plugin.module = MagicMock(run=lambda context: quick.append(context.event))
+        self.loader.plugins[plugin.name] = plugin
+        self.loader.compile_routes()
+        for _ in range(3):
+            self.get_image(None)
+        self.assertEqual(len(quick), 3)
+        self.assertEqual(self.blocking.stats()['timeouts'], 0)
+        self.assertEqual(self.blocking.stats()['expired'], 0)
+
+    def test_plugin_errors_are_counted(self):
+        self.add(MagicMock(side_effect=ValueError('boom'), mode=None, timeout=None))
+        self.assertEqual(self.get_image(None), 'image')
+        self.assertEqual(self.executor.stats()['errors'], 1)
+
+    def test_subscribe_declares_mode_and_timeout(self):
+        handler = subscribe(['post_get_image'], mode=BACKGROUND, timeout=2)(self.slow)
+        plugin = Plugin()
+        plugin.meta = fake_meta
+        plugin.module = MagicMock(run=handler)
+        self.assertEqual((plugin.mode, plugin.timeout), (BACKGROUND, 2))
+
+    def test_validator_rejects_unknown_mode(self):
+        meta = dict(fake_meta, mode='sometimes')
+        with patch.object(PluginMeta, 'get_meta_content', return_value=meta):
+            validator = PluginValidator(meta['name'])
+        self.assertFalse(validator.validate_mode())
@@ -0,0 +1,162 @@
+import json
+import os
+import shutil
+import signal
+import socket
+import tempfile
+import threading
+import time
+import unittest
+
+from unittest.mock import patch
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+from PIL import Image
+
+from meme_maker import server as server_module
+from meme_maker.server import MemeHTTPServer, WorkerError, serve
+from meme_maker.storage import LocalStorage, StorageError
+
+
+class MemeServerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp() + '/'
+        LocalStorage(self.path)
+        Image.new('RGB', (200, 100)).save(os.path.join(self.path, 'me/mplate/test.png'))
+
+        self.server = MemeHTTPServer(('127.0.0.1', 0), self.path, threads=1, queue_size=0)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.url = 'http://127.0.0.1:%s' % self.server.server_address[1]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        shutil.rmtree(self.path)
+
+    def request(self, path, payload=None):
+        data = json.dumps(payload).encode('utf-8') if payload is not None else None
+        try:
+            with urlopen(Request(self.url + path, data=data), timeout=10) as response:
+                return response.status, json.loads(response.read().decode('utf-8'))
+        except HTTPError as exc:
+            body = exc.read().decode('utf-8')
+            return exc.code, json.loads(body) if body else None
+
+    def test_healthz(self):
+        status, body = self.request('/healthz')
+        self.assertEqual(status, 200)
+        self.assertEqual(body['pid'], os.getpid())
+
+    def test_render_meme(self):
+        status, body = self.request('/meme', {'meme': 'test', 'text': 'such|wow'})
+        self.assertEqual(status, 200)
+        self.assertTrue(os.path.isfile(body['path']))
+
+        status, metrics = self.request('/metrics')
+        self.assertEqual(status, 200)
+        self.assertIn('make_meme', metrics['metrics']['timings'])
+
+    def test_render_requires_template(self):
+        status, body = self.request('/meme?text=hi')
+        self.assertEqual(status, 400)
+
+    def test_requests_above_queue_size_are_rejected(self):
+        started, release = threading.Event(), threading.Event()
+
+        def make_meme(job):
+            started.set()
+            release.wait(10)
+            return '/dev/null'
+
+        results = []
+        with patch.object(self.server, 'make_meme', side_effect=make_meme):
+            busy = threading.Thread(target=lambda: results.append(
+                self.request('/meme', {'meme': 'test'})))
+            busy.start()
+            started.wait(10)
+            status, _ = self.request('/meme', {'meme': 'test'})
+            health, _ = self.request('/healthz')
+            release.set()
+            busy.join()
+        self.assertEqual(status, 503)
+        self.assertEqual(health, 200)
+        self.assertEqual(results[0][0], 200)
+
+    def test_slow_clients_above_queue_size_do_not_block_probes(self):
+        started, release = threading.Event(), threading.Event()
+
+        def make_meme(job):
+            started.set()
+            release.wait(10)
+            return '/dev/null'
+
+        with patch.object(self.server, 'make_meme', side_effect=make_meme):
+            busy = threading.Thread(target=self.request, args=('/meme', {'meme': 'test'}))
+            busy.start()
+            started.wait(10)
+            # Connected, but the request line has not been sent yet.
+            slow = [socket.create_connection(self.server.server_address) for _ in range(3)]
+            start = time.perf_counter()
+            health, _ = self.request('/healthz')
+            elapsed = time.perf_counter() - start
+            release.set()
+            busy.join()
+            for client in slow:
+                client.close()
+        self.assertEqual(health, 200)
+        self.assertLess(elapsed, self.server.probe_timeout)
+
+
+@unittest.skipUnless(hasattr(os, 'fork'), 'needs fork')
+class PreforkTestCase(unittest.TestCase):
+    def test_stopped_workers_flush_plugins(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        warm = MemeHTTPServer.warm
+
+        def touch(name):
+            open(os.path.join(directory, '%s-%s' % (name, os.getpid())), 'w').close()
+
+        def warm_and_touch(server):
+            warm(server)
+            touch('ready')
+
+        with patch.object(MemeHTTPServer, 'warm', autospec=True, side_effect=warm_and_touch), \
+                patch.object(server_module.plugins, 'flush', side_effect=lambda *args: touch('flushed')):
+            pid = os.fork()
+            if pid == 0:
+                status = 1
+                try:
+                    serve('127.0.0.1', 0, directory + '/', workers=2)
+                    status = 0
+                finally:
+                    os._exit(status)
+            deadline = time.time() + 10
+            while time.time() < deadline and len(
+                    [name for name in os.listdir(directory) if name.startswith('ready')]) < 2:
+                time.sleep(0.05)
+            os.kill(pid, signal.SIGTERM)
+            _, status = os.waitpid(pid, 0)
+        self.assertEqual(os.waitstatus_to_exitcode(status), 0)
+        flushed = [name for name in os.listdir(directory) if name.startswith('flushed')]
+        self.assertEqual(len(flushed), 2)
+
+    def test_workers_failing_to_start_are_not_restarted_forever(self):
+        forks = []
+        fork = os.fork
+
+        def counted_fork():
+            pid = fork()
+            if pid:
+                forks.append(pid)
+            return pid
+
+        with patch.object(MemeHTTPServer, 'warm', side_effect=StorageError('unreachable')), \
+                patch.object(server_module, 'RESTART_BACKOFF', 0.01), \
+                patch.object(server_module.os, 'fork', side_effect=counted_fork):
+            with self.assertRaises(WorkerError):
+                serve('127.0.0.1', 0, '/tmp/', workers=2)
+        self.assertEqual(len(forks), 2 + server_module.MAX_RESTARTS)
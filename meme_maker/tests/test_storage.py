@@ -0,0 +1,169 @@
+import logging
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+import unittest.mock
+
+from meme_maker import storage as storage_module
+from meme_maker.storage import (
+    LocalStorage,
+    MemoryStorage,
+    S3Storage,
+    StorageError,
+    forget_storages,
+    recognize_storage
+)
+
+try:
+    import boto3
+    from moto import mock_aws
+except ImportError:
+    mock_aws = None
+
+logger = logging.getLogger('meme')
+
+
+class LocalStorageTestCase(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp() + '/'
+        self.storage = recognize_storage(self.path, logger)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_recognizes_local_directory_and_creates_structure(self):
+        self.assertIsInstance(self.storage, LocalStorage)
+        self.assertTrue(os.path.isdir(os.path.join(self.path, 'me/mplate')))
+
+    def test_write_read_roundtrip(self):
+        path = self.path + 'me/me/a.png'
+        self.storage.write(path, b'data', 'image/png')
+        self.assertTrue(self.storage.exists(path))
+        self.assertEqual(self.storage.read(path), b'data')
+
+    def test_read_missing_raises_storage_error(self):
+        with self.assertRaises(StorageError):
+            self.storage.read(self.path + 'missing.png')
+
+    def test_list_skips_temporary_files(self):
+        self.storage.write(self.path + 'me/mplate/a.png', b'data', 'image/png')
+        open(self.path + 'me/mplate/.tmp', 'w').close()
+        self.assertEqual(list(self.storage.list(self.path + 'me/mplate/')),
+                         [(self.path + 'me/mplate/a.png', 4)])
+
+
+class MemoryStorageTestCase(unittest.TestCase):
+    def test_write_read_roundtrip(self):
+        storage = MemoryStorage()
+        storage.write('me/me/a.png', b'data', 'image/png')
+        self.assertEqual(storage.read('me/me/a.png'), b'data')
+        self.assertFalse(storage.exists('me/me/b.png'))
+
+
+@unittest.skipIf(mock_aws is None, 'moto is not installed')
+class S3StorageTestCase(unittest.TestCase):
+    def setUp(self):
+        os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+        self.mock = mock_aws()
+        self.mock.start()
+        self.client = boto3.client('s3')
+        self.client.create_bucket(Bucket='memes')
+        forget_storages()
+
+    def tearDown(self):
+        forget_storages()
+        self.mock.stop()
+
+    def test_recognized_storage_is_cached_per_path(self):
+        storage = S3Storage('memes', 'prefix/', client=self.client)
+        with unittest.mock.patch('meme_maker.storage.S3Storage',
+                                 return_value=storage) as factory:
+            first = recognize_storage('memes/prefix', logger)
+            second = recognize_storage('memes/prefix', logger)
+        self.assertIs(first, second)
+        self.assertEqual(factory.call_count, 1)
+        self.assertEqual(first.path, 'prefix/')
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'needs fork')
+    def test_forked_child_does_not_reuse_parent_clients(self):
+        with unittest.mock.patch('meme_maker.storage.get_s3_client',
+                                 return_value=self.client):
+            parent = recognize_storage('memes/prefix', logger)
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            reused = storage_module._recognized.get('memes/prefix') is parent
+            os.write(write_fd, b'1' if reused or storage_module._s3_client else b'0')
+            os._exit(0)
+        os.close(write_fd)
+        result = os.read(read_fd, 1)
+        os.close(read_fd)
+        os.waitpid(pid, 0)
+        self.assertEqual(result, b'0')
+
+    def test_unknown_bucket_raises_storage_error(self):
+        with unittest.mock.patch('meme_maker.storage.get_s3_client',
+                                 return_value=self.client):
+            with self.assertRaises(StorageError):
+                recognize_storage('no-such-bucket', logger)
+
+    def test_write_read_roundtrip(self):
+        storage = S3Storage('memes', '', client=self.client)
+        storage.write('me/me/a.png', b'data', 'image/png')
+        self.assertTrue(storage.exists('me/me/a.png'))
+        self.assertEqual(storage.read('me/me/a.png'), b'data')
+        head = self.client.head_object(Bucket='memes', Key='me/me/a.png')
+        self.assertEqual(head['ContentType'], 'image/png')
+
+    def test_list_pages_through_prefix(self):
+        storage = S3Storage('memes', 'prefix/', client=self.client)
+        for name in ('a', 'b', 'c'):
+            storage.write('prefix/me/mplate/%s.png' % name, b'data', 'image/png')
+        storage.write('prefix/me/me/d.png', b'data', 'image/png')
+        with unittest.mock.patch.object(self.client, 'get_paginator',
+                                        wraps=self.client.get_paginator) as paginator:
+            listed = sorted(storage.list('prefix/me/mplate/'))
+        paginator.assert_called_once_with('list_objects_v2')
+        self.assertEqual(listed, [('prefix/me/mplate/%s.png' % name, 4) for name in 'abc'])
+
+    def test_large_write_uses_multipart_upload(self):
+        storage = S3Storage('memes', '', client=self.client)
+        storage.multipart_threshold = 5 * 1024 * 1024
+        data = b'x' * (6 * 1024 * 1024)
+        with unittest.mock.patch.object(self.client, 'upload_fileobj',
+                                        wraps=self.client.upload_fileobj) as upload:
+            storage.write('me/me/big.png', data, 'image/png')
+        upload.assert_called_once()
+        self.assertEqual(storage.read('me/me/big.png'), data)
+
+
+class LocalStorageAtomicWriteTestCase(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp() + '/'
+        self.storage = LocalStorage(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_write_leaves_no_temporary_files(self):
+        self.storage.write(self.path + 'me/me/a.png', memoryview(b'data'), 'image/png')
+        self.assertEqual(os.listdir(self.path + 'me/me'), ['a.png'])
+
+    def test_failed_write_keeps_previous_file(self):
+        path = self.path + 'me/me/a.png'
+        self.storage.write(path, b'old', 'image/png')
+        with self.assertRaises(TypeError):
+            self.storage.write(path, object(), 'image/png')
+        self.assertEqual(self.storage.read(path), b'old')
+        self.assertEqual(os.listdir(self.path + 'me/me'), ['a.png'])
+
+    def test_written_files_get_default_permissions(self):
+        path = self.path + 'me/me/a.png'
+        self.storage.write(path, b'data', 'image/png')
+        with open(self.path + 'plain', 'wb'):
+            pass
+        self.assertEqual(stat.S_IMODE(os.stat(path).st_mode),
+                         stat.S_IMODE(os.stat(self.path + 'plain').st_mode))
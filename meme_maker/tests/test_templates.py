@@ -0,0 +1,116 @@
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+from unittest.mock import patch
+
+from PIL import Image
+
+from meme_maker.meme import Meme
+from meme_maker.templates import TemplateCache
+
+
+class TemplateCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.image = Image.new('RGB', (40, 30), 'red')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_memory_tier_is_bounded_by_pixel_bytes(self):
+        cache = TemplateCache(maxbytes=40 * 30 * 3)
+        cache.put('a', self.image)
+        cache.put('b', self.image)
+        self.assertIsNone(cache.get('a'))
+        self.assertIs(cache.get('b'), self.image)
+
+    def test_disk_tier_survives_new_cache(self):
+        TemplateCache(directory=self.directory).put('a', self.image)
+        cache = TemplateCache(directory=self.directory)
+        image = cache.get('a')
+        self.assertEqual(image.convert('RGB').tobytes(), self.image.tobytes())
+        self.assertEqual(cache.stats()['disk_hits'], 1)
+
+    def test_disk_tier_is_mapped_read_only_with_stored_digest(self):
+        TemplateCache(directory=self.directory).put('a', self.image, 'ab' * 20)
+        cache = TemplateCache(directory=self.directory)
+        image = cache.get('a')
+        self.assertTrue(image.readonly)
+        self.assertEqual(cache.digest('a'), 'ab' * 20)
+
+        copy = image.convert('RGB')
+        copy.paste((0, 0, 255), (0, 0, 10, 10))
+        self.assertEqual(image.getpixel((0, 0))[:3], (255, 0, 0))
+
+    def test_disk_tier_unlinks_least_recently_used_files(self):
+        entry = TemplateCache.header.size + 40 * 30 * 4
+        cache = TemplateCache(directory=self.directory, disk_maxbytes=2 * entry)
+        cache.put('a', self.image)
+        cache.put('b', self.image)
+        os.utime(cache.disk_path('a'), (100, 100))
+        os.utime(cache.disk_path('b'), (200, 200))
+
+        TemplateCache(directory=self.directory).get('a')
+        cache.put('c', self.image)
+        self.assertTrue(os.path.exists(cache.disk_path('a')))
+        self.assertFalse(os.path.exists(cache.disk_path('b')))
+        self.assertTrue(os.path.exists(cache.disk_path('c')))
+
+    def test_corrupted_disk_entry_is_a_miss(self):
+        cache = TemplateCache(directory=self.directory)
+        with open(cache.disk_path('a'), 'wb') as f:
+            f.write(b'garbage')
+        self.assertIsNone(cache.get('a'))
+
+
+class MemeTemplateCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp() + '/'
+        self.cache = TemplateCache()
+        self.logger = logging.getLogger('meme')
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_cached_template_skips_storage_and_network(self):
+        meme = Meme(self.logger, None, 'http://example.com/t.png', 'hi',
+                    template_cache=self.cache)
+        meme.recognize_storage(self.path)
+        meme.template_name = meme.generate_template_name()
+        self.cache.put(meme.template_key(), Image.new('RGB', (200, 100)))
+
+        with patch.object(Meme, 'get_image') as get_image, \
+                patch.object(Meme, 'get_image_from_url') as get_image_from_url:
+            self.assertTrue(os.path.isfile(meme.make_meme(self.path)))
+        get_image.assert_not_called()
+        get_image_from_url.assert_not_called()
+
+    def test_stored_template_is_preferred_over_download(self):
+        meme = Meme(self.logger, 'test', 'http://example.com/t.png', 'hi',
+                    template_cache=self.cache)
+        meme.recognize_storage(self.path)
+        Image.new('RGB', (200, 100)).save(os.path.join(self.path, 'me/mplate/test.png'))
+        with patch.object(Meme, 'get_image_from_url') as get_image_from_url:
+            meme.make_meme(self.path)
+        get_image_from_url.assert_not_called()
+
+    def test_warm_template_serves_many_captions(self):
+        cache = TemplateCache(directory=tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, cache.directory)
+        template = Image.new('RGB', (200, 100), 'navy')
+        cache.put(('local:' + self.path, 'test'), template)
+        cache.memory.clear()
+
+        paths = []
+        with patch.object(Meme, 'get_image') as get_image:
+            for text in ('one', 'two|three'):
+                meme = Meme(self.logger, 'test', None, text, template_cache=cache)
+                paths.append(meme.make_meme(self.path))
+        get_image.assert_not_called()
+        self.assertNotEqual(paths[0], paths[1])
+        cached = cache.get(('local:' + self.path, 'test'))
+        self.assertTrue(cached.readonly)
+        self.assertEqual(cached.convert('RGB').tobytes(), template.tobytes())